@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# Compares i3hub running on the asyncio and uvloop event loops. For each loop,
+# i3hub runs as a status command in a child process connected to a mock i3 IPC
+# socket, using the same connect/setup_i3bar_streams/setup_signals paths as
+# `i3hub --run-as-status`. Measured:
+#
+# - dispatch throughput: i3 window events dispatched to an extension per second
+# - frame latency: time from an i3 binding event until the i3bar frame it
+#   triggers is read from the child stdout
+#
+# Run from the repository root:
+#
+#     python3 bench/event_loops.py [events] [frames]
+import json
+import os
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAGIC = b'i3-ipc'
+HEADER_SIZE = len(MAGIC) + 8
+WINDOW_EVENT = 3
+BINDING_EVENT = 5
+
+CHILD_SCRIPT = '''
+import asyncio
+import sys
+
+import i3hub
+from i3hub import listen, nop
+
+loop_name = sys.argv[1]
+count = int(sys.argv[2])
+received = 0
+frame = None
+
+
+@listen('i3::window')
+async def on_window(i3, event, arg):
+    global received
+    received += 1
+    if received == count:
+        await i3.command('done')
+
+
+@nop('frame')
+async def on_frame(i3, event, args):
+    global frame
+    frame = args[0]
+    i3.refresh_i3bar()
+
+
+@listen('i3hub::i3bar_refresh')
+async def on_i3bar_refresh(i3, event, status_array):
+    status_array.append({'full_text': frame})
+
+
+async def main(loop):
+    i3bar_reader, i3bar_writer = await i3hub.setup_i3bar_streams(loop)
+    conn = await i3hub.connect(loop=loop)
+    hub = i3hub.I3Hub(loop, conn, i3bar_reader, i3bar_writer,
+            [('bench', sys.modules[__name__])], {'i3hub': {}})
+    i3hub.setup_signals(loop, hub)
+    await hub.run()
+
+
+loop = i3hub.new_event_loop(loop_name)
+asyncio.set_event_loop(loop)
+sys.stderr.write('{}\\n'.format(type(loop).__module__))
+loop.run_until_complete(main(loop))
+loop.close()
+'''
+
+
+def available_loops():
+    loops = ['asyncio']
+    try:
+        import uvloop
+    except ImportError:
+        print('uvloop is not installed, only measuring asyncio')
+    else:
+        loops.append('uvloop')
+    return loops
+
+
+def message(msg_type, payload):
+    body = json.dumps(payload).encode('utf-8')
+    return MAGIC + struct.pack('=II', len(body), msg_type) + body
+
+
+def event(event_type, payload):
+    return message(event_type | 0x80000000, payload)
+
+
+def recv_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise Exception('i3hub closed the connection')
+        data += chunk
+    return data
+
+
+def recv_message(sock):
+    header = recv_exactly(sock, HEADER_SIZE)
+    length, msg_type = struct.unpack('=II', header[len(MAGIC):])
+    return msg_type, recv_exactly(sock, length).decode('utf-8')
+
+
+def read_frame(stdout):
+    line = stdout.readline()
+    if not line:
+        raise Exception('i3hub exited')
+    return json.loads(line.lstrip(b','))
+
+
+def run(loop_name, script, socket_path, events, frames):
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(1)
+    env = dict(os.environ, I3SOCK=socket_path, PYTHONPATH=os.pathsep.join(
+        [ROOT, os.environ.get('PYTHONPATH', '')]))
+    proc = subprocess.Popen([sys.executable, script, loop_name, str(events)],
+            env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
+    try:
+        used = proc.stderr.readline().decode().strip()
+        conn, _ = server.accept()
+        msg_type, payload = recv_message(conn)
+        assert msg_type == 2, 'expected a subscribe request'
+        conn.sendall(message(2, {'success': True}))
+        # i3bar protocol header and start of the infinite array
+        proc.stdout.readline()
+        proc.stdout.readline()
+        # dispatch throughput
+        window_events = event(WINDOW_EVENT, {'change': 'focus'}) * events
+        started = time.perf_counter()
+        conn.sendall(window_events)
+        msg_type, payload = recv_message(conn)
+        elapsed = time.perf_counter() - started
+        assert msg_type == 0 and payload == 'done'
+        conn.sendall(message(0, [{'success': True}]))
+        # frame latency
+        latencies = []
+        for i in range(frames):
+            binding = event(BINDING_EVENT, {'change': 'run',
+                'binding': {'command': 'nop frame {}'.format(i)}})
+            started = time.perf_counter()
+            conn.sendall(binding)
+            while read_frame(proc.stdout) != [{'full_text': str(i)}]:
+                pass
+            latencies.append(time.perf_counter() - started)
+        # stop through the SIGTERM handler
+        proc.send_signal(signal.SIGTERM)
+        if proc.wait(timeout=10) != 0:
+            raise Exception('i3hub did not exit cleanly')
+        conn.close()
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        server.close()
+        os.unlink(socket_path)
+    latencies.sort()
+    return used, events / elapsed, latencies
+
+
+def main():
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    print('{:<10} {:>14} {:>14} {:>14}'.format('loop', 'events/s',
+        'frame median', 'frame p99'))
+    with tempfile.TemporaryDirectory() as tmp:
+        script = os.path.join(tmp, 'bench_extension.py')
+        with open(script, 'w') as f:
+            f.write(CHILD_SCRIPT)
+        for loop_name in available_loops():
+            used, throughput, latencies = run(loop_name, script,
+                    os.path.join(tmp, 'ipc-socket'), events, frames)
+            if not used.startswith(loop_name):
+                raise Exception('expected the {} loop, got {}'.format(
+                    loop_name, used))
+            print('{:<10} {:>14.0f} {:>12.1f}us {:>12.1f}us'.format(
+                loop_name, throughput,
+                latencies[len(latencies) // 2] * 1e6,
+                latencies[int(len(latencies) * 0.99)] * 1e6))
+
+
+if __name__ == '__main__':
+    main()
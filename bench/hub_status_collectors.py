@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# Compares the cost of hub_status native /proc and /sys collectors against the
+# psutil fallback. Run from the repository root:
+#
+#     python3 bench/hub_status_collectors.py [iterations]
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'contrib'))
+
+import psutil
+
+import hub_status
+
+
+def default_nic():
+    with open('/proc/net/dev') as f:
+        lines = f.readlines()[2:]
+    for line in lines:
+        name = line.split(':', 1)[0].strip()
+        if name != 'lo':
+            return name
+    return 'lo'
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    nic = default_nic()
+    cpu = hub_status.CpuCollector()
+    memory = hub_status.MemoryCollector()
+    net_dev = hub_status.NetDevCollector()
+    battery = hub_status.native_collector(hub_status.BatteryCollector)
+    cases = [
+        ('cpu', cpu.percent, psutil.cpu_percent),
+        ('memory', memory.total_available, psutil.virtual_memory),
+        ('network', lambda: net_dev.counters(nic),
+            lambda: psutil.net_io_counters(pernic=True).get(nic)),
+    ]
+    if battery:
+        cases.append(('battery', battery.state, psutil.sensors_battery))
+    print('{:<10} {:>12} {:>12} {:>8}'.format('probe', 'native (us)',
+        'psutil (us)', 'speedup'))
+    for name, native, fallback in cases:
+        native_time = timeit.timeit(native, number=iterations)
+        psutil_time = timeit.timeit(fallback, number=iterations)
+        print('{:<10} {:>12.2f} {:>12.2f} {:>7.1f}x'.format(name,
+            native_time / iterations * 1e6, psutil_time / iterations * 1e6,
+            psutil_time / native_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# Measures i3hub startup costs: the import time of the i3hub module (as
+# reported by `python -X importtime`) and the time from starting a python
+# process until it is connected to a mock i3 IPC socket. Run from the
+# repository root:
+#
+#     python3 bench/startup.py [runs]
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONNECT_SCRIPT = '''
+import asyncio
+import sys
+import i3hub
+loop = asyncio.new_event_loop()
+asyncio.set_event_loop(loop)
+reader, writer = loop.run_until_complete(asyncio.open_unix_connection(
+    i3hub.get_socket_path()))
+conn = i3hub.I3Connection(loop, reader, writer)
+sys.stdout.write('connected\\n')
+sys.stdout.flush()
+'''
+
+
+def import_time():
+    # the last line reported by -X importtime for the i3hub module contains
+    # the cumulative time in microseconds
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+        'import i3hub'], cwd=ROOT, stderr=subprocess.PIPE,
+        check=True).stderr.decode()
+    for line in reversed(stderr.splitlines()):
+        fields = [f.strip() for f in line.split('|')]
+        if len(fields) == 3 and fields[2] == 'i3hub':
+            return int(fields[1])
+    raise Exception('i3hub not found in importtime output')
+
+
+def serve(server):
+    # accept connections and keep them open until the client goes away
+    while True:
+        try:
+            client, _ = server.accept()
+        except OSError:
+            return
+        client.recv(1)
+        client.close()
+
+
+def time_to_connected(socket_path):
+    env = dict(os.environ, I3SOCK=socket_path)
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-c', CONNECT_SCRIPT], cwd=ROOT,
+            env=env, stdout=subprocess.PIPE)
+    line = proc.stdout.readline()
+    elapsed = time.perf_counter() - started
+    proc.wait()
+    if line != b'connected\n':
+        raise Exception('failed to connect to the mock socket')
+    return elapsed
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    with tempfile.TemporaryDirectory() as tmp:
+        socket_path = os.path.join(tmp, 'ipc-socket')
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(socket_path)
+        server.listen(16)
+        threading.Thread(target=serve, args=(server,), daemon=True).start()
+        imports = sorted(import_time() for _ in range(runs))
+        connected = sorted(time_to_connected(socket_path)
+                for _ in range(runs))
+        server.close()
+    print('{:<20} {:>10} {:>10}'.format('', 'median', 'min'))
+    print('{:<20} {:>8.2f}ms {:>8.2f}ms'.format('import i3hub',
+        imports[len(imports) // 2] / 1000, imports[0] / 1000))
+    print('{:<20} {:>8.2f}ms {:>8.2f}ms'.format('time to connected',
+        connected[len(connected) // 2] * 1000, connected[0] * 1000))
+
+
+if __name__ == '__main__':
+    main()
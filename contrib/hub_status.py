@@ -7,19 +7,388 @@
 # this:
 #     [hub_status]
 #     disable = ["battery", "network"]
+#
+# Probes that touch the filesystem or hardware (everything except the date)
+# run in a small thread pool, so a hung NFS mount or slow ACPI can't block the
+# event loop. A probe that doesn't finish within `probe_timeout` seconds is
+# rendered as stale (greyed out, or "?" if it never succeeded):
+#     [hub_status]
+#     probe_timeout = 2
+#     probe_workers = 2
+#
+# On Linux, cpu, memory, network counters and battery are read directly from
+# /proc and /sys through persistent file descriptors, which is a lot cheaper
+# than going through psutil on every tick. psutil is still used as a fallback
+# when those files are not available, or when disabled in configuration:
+#     [hub_status]
+#     native_collectors = false
+#
+# Network and battery state are event driven on Linux: rtnetlink
+# notifications invalidate the cached default gateway and interface addresses,
+# and power_supply uevents refresh the battery widget, so changes are shown
+# immediately. The network widget still runs periodically to compute
+# throughput, and the battery widget falls back to a slow poll since not all
+# drivers emit uevents for capacity changes. Set `netlink = false` to poll
+# everything.
+#
+# cpu, memory and per-interface network rates are recorded in fixed size
+# history buffers. Network rates are smoothed with an exponentially weighted
+# moving average, and widgets can optionally show a sparkline of their recent
+# history:
+#     [hub_status]
+#     sparklines = ["cpu", "memory", "network"]
+#     history_size = 20
+#     ewma_alpha = 0.3
+#
+# Update intervals adapt to activity: a widget whose output didn't change is
+# polled half as often, up to its maximum interval, and goes back to its
+# minimum interval as soon as the output changes. cpu, memory and network
+# are considered changed when their value moves by more than a tolerance (5
+# percentage points of cpu, 2% of the memory, 25% of the network rate), so
+# noise doesn't keep them at the minimum interval. When running on battery the
+# intervals are multiplied by `on_battery_factor` (this relies on the battery
+# widget being enabled). Bounds are configured per widget, in seconds:
+#     [hub_status]
+#     intervals = {"cpu": [5, 30], "network": [10, 60]}
+#     on_battery_factor = 2
+import array
 import asyncio
+import concurrent.futures
 import datetime
+import errno
 import json
+import logging
 import os
 import signal
+import socket
 import psutil
 
-from i3hub import extension, listen, status_array_merge
+from i3hub import extension, listen
+
 
+logger = logging.getLogger(__name__)
 
 KB = 1024
 MB = KB * 1024
 GB = MB * 1024
+POWER_SUPPLY_DIR = '/sys/class/power_supply'
+NETLINK_ROUTE = 0
+NETLINK_KOBJECT_UEVENT = 15
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+RTMGRP_IPV6_IFADDR = 0x100
+RTMGRP_IPV6_ROUTE = 0x400
+UEVENT_KERNEL_GROUP = 1
+# netlink notifications tend to arrive in bursts, wait a bit before refreshing
+NETLINK_DEBOUNCE = 0.1
+BATTERY_EVENT_INTERVAL = 300
+HISTORY_SIZE = 20
+EWMA_ALPHA = 0.3
+ON_BATTERY_FACTOR = 2
+# how much the value of a widget has to move for it to count as changed
+CPU_CHANGE = 5.0
+MEMORY_CHANGE = 0.02
+NETWORK_CHANGE = 0.25
+SPARKLINE_CHARS = '\u2581\u2582\u2583\u2584\u2585\u2586\u2587\u2588'
+PROBE_TIMEOUT = 2
+PROBE_WORKERS = 2
+STALE_COLOR = '#888888'
+# widgets that are cheap enough to run directly on the event loop
+INLINE_WIDGETS = ('date',)
+
+
+class ProcFile(object):
+    # A /proc or /sys file that is kept open and re-read with pread into a
+    # reusable buffer. Parsing is done directly on the buffer, so only the
+    # needed fields are ever converted to python objects.
+    def __init__(self, path, size=4096):
+        self._fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+        self.buf = bytearray(size)
+        self.size = 0
+
+    def read(self):
+        while True:
+            if hasattr(os, 'preadv'):
+                n = os.preadv(self._fd, [self.buf], 0)
+            else:
+                data = os.pread(self._fd, len(self.buf), 0)
+                n = len(data)
+                self.buf[:n] = data
+            if n < len(self.buf):
+                break
+            # the file didn't fit, grow the buffer and try again
+            self.buf = bytearray(len(self.buf) * 2)
+        self.size = n
+        return n
+
+    def field(self, key, start=0):
+        # return the integer that follows `key`
+        i = self.buf.find(key, start, self.size)
+        if i == -1:
+            return None
+        i += len(key)
+        while i < self.size and self.buf[i] == 0x20:
+            i += 1
+        j = i
+        while j < self.size and 0x30 <= self.buf[j] <= 0x39:
+            j += 1
+        return int(self.buf[i:j])
+
+    def close(self):
+        os.close(self._fd)
+
+
+class CpuCollector(object):
+    def __init__(self, path='/proc/stat'):
+        self._stat = ProcFile(path)
+        self._last_busy = 0
+        self._last_total = 0
+        # baseline, so the first reading isn't the average since boot
+        self.percent()
+
+    def percent(self):
+        stat = self._stat
+        stat.read()
+        end = stat.buf.find(b'\n', 0, stat.size)
+        # user nice system idle iowait irq softirq steal
+        fields = stat.buf[5:end].split(None, 8)[:8]
+        total = 0
+        for f in fields:
+            total += int(f)
+        busy = total - int(fields[3]) - int(fields[4])
+        dt = total - self._last_total
+        db = busy - self._last_busy
+        self._last_total = total
+        self._last_busy = busy
+        if dt <= 0:
+            return 0.0
+        return 100.0 * db / dt
+
+    def close(self):
+        self._stat.close()
+
+
+class MemoryCollector(object):
+    def __init__(self, path='/proc/meminfo'):
+        self._meminfo = ProcFile(path)
+
+    def total_available(self):
+        meminfo = self._meminfo
+        meminfo.read()
+        # values are in kB
+        total = meminfo.field(b'MemTotal:')
+        available = meminfo.field(b'MemAvailable:')
+        if available is None:
+            # not reported by kernels older than 3.14 and some containers
+            available = sum(meminfo.field(key) or 0 for key in (
+                b'\nMemFree:', b'\nBuffers:', b'\nCached:'))
+        return total * KB, available * KB
+
+    def close(self):
+        self._meminfo.close()
+
+
+class NetDevCollector(object):
+    def __init__(self, path='/proc/net/dev'):
+        self._dev = ProcFile(path)
+
+    def counters(self, nic):
+        dev = self._dev
+        dev.read()
+        key = nic.encode() + b':'
+        i = 0
+        while True:
+            i = dev.buf.find(key, i, dev.size)
+            if i == -1:
+                return None
+            if dev.buf[i - 1] in (0x20, 0x0a):
+                break
+            i += len(key)
+        end = dev.buf.find(b'\n', i, dev.size)
+        fields = dev.buf[i + len(key):end].split(None, 9)
+        # bytes received is the first field, bytes sent is the ninth
+        return int(fields[0]), int(fields[8])
+
+    def close(self):
+        self._dev.close()
+
+
+class BatteryState(object):
+    __slots__ = ('percent', 'power_plugged')
+
+    def __init__(self):
+        self.percent = 0
+        self.power_plugged = False
+
+
+class BatteryCollector(object):
+    def __init__(self, power_supply_dir=POWER_SUPPLY_DIR):
+        self._capacity = None
+        self._status = None
+        self._online = []
+        self._state = BatteryState()
+        for name in sorted(os.listdir(power_supply_dir)):
+            path = os.path.join(power_supply_dir, name)
+            with open(os.path.join(path, 'type')) as f:
+                supply_type = f.read().strip()
+            if supply_type == 'Battery' and self._capacity is None:
+                self._capacity = ProcFile(os.path.join(path, 'capacity'), 64)
+                self._status = ProcFile(os.path.join(path, 'status'), 64)
+            elif supply_type == 'Mains':
+                self._online.append(ProcFile(os.path.join(path, 'online'), 64))
+
+    def state(self):
+        if self._capacity is None:
+            return None
+        self._capacity.read()
+        self._state.percent = self._capacity.field(b'')
+        self._status.read()
+        plugged = self._status.buf.startswith((b'Charging', b'Full'))
+        for online in self._online:
+            online.read()
+            plugged = plugged or online.buf[0] == 0x31
+        self._state.power_plugged = plugged
+        return self._state
+
+    def close(self):
+        for f in [self._capacity, self._status] + self._online:
+            if f:
+                f.close()
+
+
+class RingBuffer(object):
+    # Fixed size history of float samples. Appending is O(1) and never
+    # allocates after construction.
+    def __init__(self, size):
+        self._data = array.array('d', bytes(8 * size))
+        self._size = size
+        self._index = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        # oldest to newest
+        start = (self._index - self._count) % self._size
+        for i in range(self._count):
+            yield self._data[(start + i) % self._size]
+
+    def append(self, value):
+        self._data[self._index] = value
+        self._index = (self._index + 1) % self._size
+        if self._count < self._size:
+            self._count += 1
+
+    def max(self):
+        return max(self._data) if self._count == self._size else max(
+                self, default=0.0)
+
+
+class Metric(object):
+    def __init__(self, size, alpha):
+        self.history = RingBuffer(size)
+        self.alpha = alpha
+        self.smoothed = None
+
+    def add(self, value):
+        self.history.append(value)
+        if self.smoothed is None:
+            self.smoothed = value
+        else:
+            self.smoothed += self.alpha * (value - self.smoothed)
+        return self.smoothed
+
+
+def sparkline(history, maximum=None):
+    if maximum is None:
+        maximum = history.max()
+    if maximum <= 0:
+        return SPARKLINE_CHARS[0] * len(history)
+    top = len(SPARKLINE_CHARS) - 1
+    return ''.join(SPARKLINE_CHARS[min(top, max(0, int(v / maximum * top)))]
+            for v in history)
+
+
+def format_rate(rate):
+    if rate < KB:
+        return '{:.0f} B/s'.format(rate)
+    elif rate < MB:
+        return '{:.0f} K/s'.format(rate / KB)
+    return '{:.1f} M/s'.format(rate / MB)
+
+
+class NetlinkMonitor(object):
+    # Calls `callback` with each datagram received on a netlink multicast
+    # group. `callback` receives None if the socket buffer overflowed and
+    # notifications were lost, or when the monitor stopped after an error.
+    def __init__(self, loop, protocol, groups, callback):
+        self._loop = loop
+        self._callback = callback
+        self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                protocol)
+        self._sock.setblocking(False)
+        self._sock.bind((0, groups))
+        loop.add_reader(self._sock.fileno(), self._read)
+        self._reading = True
+
+    def _read(self):
+        while True:
+            try:
+                data = self._sock.recv(65536)
+            except BlockingIOError:
+                return
+            except OSError as e:
+                if e.errno != errno.ENOBUFS:
+                    logger.error('netlink monitor stopped: %s', e)
+                    self._stop_reading()
+                    self._callback(None)
+                    return
+                # some notifications were dropped
+                data = None
+            self._callback(data)
+
+    @property
+    def active(self):
+        return self._reading
+
+    def _stop_reading(self):
+        if self._reading:
+            self._reading = False
+            self._loop.remove_reader(self._sock.fileno())
+
+    def close(self):
+        self._stop_reading()
+        self._sock.close()
+
+
+def netlink_monitor(loop, protocol, groups, callback):
+    try:
+        return NetlinkMonitor(loop, protocol, groups, callback)
+    except (AttributeError, OSError):
+        return None
+
+
+def interval_bounds(name, configured, default):
+    # validate the [minimum, maximum] interval of a widget, timers run at
+    # most once per second
+    if configured is None:
+        return default
+    try:
+        minimum, maximum = (int(v) for v in configured)
+    except (TypeError, ValueError):
+        logger.warning('invalid intervals for "%s": %s', name, configured)
+        return default
+    minimum = max(minimum, 1)
+    return minimum, max(minimum, maximum)
+
+
+def native_collector(cls):
+    try:
+        return cls()
+    except (OSError, ValueError):
+        return None
 
 
 @extension()
@@ -35,8 +404,36 @@ class HubStatus(object):
         self._updating = False
         self._proc_net_route = None
         self._current_status = []
-        self._counters = psutil.net_io_counters(pernic=True, nowrap=True)
-        self._counters_timestamp = datetime.datetime.now().timestamp()
+        self._executor = None
+        self._probe_timeout = PROBE_TIMEOUT
+        self._probes = {}
+        self._last_blocks = {}
+        self._counters = {}
+        self._cpu_collector = None
+        self._memory_collector = None
+        self._net_dev_collector = None
+        self._battery_collector = None
+        self._updaters = {}
+        self._timers = {}
+        self._intervals = {}
+        self._on_battery = False
+        self._on_battery_factor = ON_BATTERY_FACTOR
+        self._history_size = HISTORY_SIZE
+        self._ewma_alpha = EWMA_ALPHA
+        self._sparklines = ()
+        self._metrics = {}
+        self._widget_order = None
+        self._route_monitor = None
+        self._uevent_monitor = None
+        self._battery_poll_bounds = None
+        self._net_state = None
+        self._net_state_generation = 0
+        self._pending_widgets = set()
+        self._pending_handle = None
+        # latest value of the widgets that have one, written by the probes,
+        # and the value each widget had when it last counted as changed
+        self._values = {}
+        self._reference_values = {}
 
     def _get_color(self, percent_usage):
         color = 'green'
@@ -58,31 +455,113 @@ class HubStatus(object):
             if len(line) > 1 and int(line[1], base=16) == 0:
                 return line[0]
 
+    def _network_state(self):
+        state = self._net_state
+        if state is None:
+            generation = self._net_state_generation
+            state = (self._get_default_gateway_interface(),
+                     psutil.net_if_stats(), psutil.net_if_addrs())
+            if (self._route_monitor and self._route_monitor.active and
+                    generation == self._net_state_generation):
+                # cache until rtnetlink tells us something changed
+                self._net_state = state
+        return state
+
+    def _on_route_event(self, data):
+        self._net_state = None
+        self._net_state_generation += 1
+        self._schedule_widget_update('network')
+
+    def _on_uevent(self, data):
+        if data is None or b'SUBSYSTEM=power_supply' in data:
+            self._schedule_widget_update('battery')
+        if not self._uevent_monitor.active and 'battery' in self._timers:
+            # no more uevents, go back to polling
+            minimum, maximum = self._battery_poll_bounds
+            self._intervals['battery'] = [minimum, maximum, minimum]
+            self._timers['battery'].set_interval(minimum)
+
+    def _schedule_widget_update(self, name):
+        if name not in self._updaters:
+            return
+        self._pending_widgets.add(name)
+        if not self._pending_handle:
+            self._pending_handle = self._loop.call_later(NETLINK_DEBOUNCE,
+                    lambda: self._loop.create_task(self._update_widgets()))
+
+    async def _update_widgets(self):
+        self._pending_handle = None
+        names, self._pending_widgets = self._pending_widgets, set()
+        refresh = False
+        for name in names:
+            if await self._updaters[name]():
+                refresh = True
+        if refresh:
+            self._i3.refresh_i3bar()
+
+    def _setup_monitors(self):
+        self._route_monitor = netlink_monitor(self._loop, NETLINK_ROUTE,
+                RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE |
+                RTMGRP_IPV6_IFADDR | RTMGRP_IPV6_ROUTE, self._on_route_event)
+        self._uevent_monitor = netlink_monitor(self._loop,
+                NETLINK_KOBJECT_UEVENT, UEVENT_KERNEL_GROUP, self._on_uevent)
+
+    def _metric(self, name):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = Metric(self._history_size,
+                    self._ewma_alpha)
+        return metric
+
+    def _sparkline(self, name, metric, maximum=None):
+        if name not in self._sparklines:
+            return ''
+        return ' ' + sparkline(metric.history, maximum)
+
+    def _setup_collectors(self):
+        self._cpu_collector = native_collector(CpuCollector)
+        self._memory_collector = native_collector(MemoryCollector)
+        self._net_dev_collector = native_collector(NetDevCollector)
+        self._battery_collector = native_collector(BatteryCollector)
+
+    def _nic_counters(self, nic):
+        if self._net_dev_collector:
+            return self._net_dev_collector.counters(nic)
+        nc = psutil.net_io_counters(pernic=True).get(nic, None)
+        if nc:
+            return nc.bytes_recv, nc.bytes_sent
+
+    def _baseline(self, now):
+        # first samples of the rate based widgets, so their first update
+        # shows the rate since init instead of "?" or the average since boot
+        if not self._cpu_collector:
+            psutil.cpu_percent()
+        timestamp = now.timestamp()
+        for nic in psutil.net_if_stats():
+            counters = self._nic_counters(nic)
+            if counters:
+                self._counters[nic] = counters + (timestamp,)
+
     def _compute_nic_throughput(self, nic, now):
-        last_counters = self._counters
-        last_timestamp = self._counters_timestamp
-        self._counters = psutil.net_io_counters(pernic=True)
-        self._counters_timestamp = now.timestamp()
-        last_nc = last_counters.get(nic, None)
-        nc = self._counters.get(nic, None)
-        if not (nc and last_nc):
+        timestamp = now.timestamp()
+        counters = self._nic_counters(nic)
+        last = self._counters.get(nic, None)
+        if not counters:
             return
-        seconds_passed = self._counters_timestamp - last_timestamp
-        download_rate = (nc.bytes_recv - last_nc.bytes_recv) / seconds_passed
-        upload_rate = (nc.bytes_sent - last_nc.bytes_sent) / seconds_passed
-        if download_rate < KB:
-            download = '{:.0f} B/s'.format(download_rate)
-        elif download_rate < MB:
-            download = '{:.0f} K/s'.format(download_rate / KB)
-        else:
-            download = '{:.1f} M/s'.format(download_rate / MB)
-        if upload_rate < KB:
-            upload = '{:.0f} B/s'.format(upload_rate)
-        elif upload_rate < MB:
-            upload = '{:.0f} K/s'.format(upload_rate / KB)
-        else:
-            upload = '{:.1f} M/s'.format(upload_rate / MB)
-        return download, upload
+        self._counters[nic] = counters + (timestamp,)
+        if not last:
+            return
+        seconds_passed = timestamp - last[2]
+        if seconds_passed <= 0:
+            return
+        rx = self._metric(nic + ':rx')
+        tx = self._metric(nic + ':tx')
+        download_rate = rx.add((counters[0] - last[0]) / seconds_passed)
+        upload_rate = tx.add((counters[1] - last[1]) / seconds_passed)
+        self._values['network'] = download_rate + upload_rate
+        return (format_rate(download_rate) +
+                self._sparkline('network', rx),
+                format_rate(upload_rate) + self._sparkline('network', tx))
 
     def _disk(self, now):
         usage = psutil.disk_usage('/')
@@ -97,38 +576,52 @@ class HubStatus(object):
         }
 
     def _memory(self, now):
-        vm = psutil.virtual_memory()
-        used = (vm.total - vm.available) / GB
-        total = vm.total / GB
+        if self._memory_collector:
+            total, available = self._memory_collector.total_available()
+        else:
+            vm = psutil.virtual_memory()
+            total, available = vm.total, vm.available
+        used = (total - available) / GB
+        total = total / GB
+        metric = self._metric('memory')
+        metric.add(used / total)
+        self._values['memory'] = used / total
         return {
             'name': 'memory',
             'markup': 'pango',
             'full_text': ('<span foreground="{}">\uf2db</span> '
-                          '{:.1f}G/{:.1f}G').format(
-                            self._get_color(used / total), used, total)
+                          '{:.1f}G/{:.1f}G{}').format(
+                            self._get_color(used / total), used, total,
+                            self._sparkline('memory', metric, 1.0))
         }
 
     def _cpu(self, now):
-        percent = psutil.cpu_percent()
+        if self._cpu_collector:
+            percent = self._cpu_collector.percent()
+        else:
+            percent = psutil.cpu_percent()
+        metric = self._metric('cpu')
+        metric.add(percent)
+        self._values['cpu'] = percent
         return {
             'name': 'cpu',
             'markup': 'pango',
             'full_text': ('<span foreground="{}">\uf233</span> '
-                          '{:.0f} %').format(self._get_color(percent / 100),
-                              percent)
+                          '{:.0f} %{}').format(self._get_color(percent / 100),
+                              percent, self._sparkline('cpu', metric, 100.0))
         }
 
     def _network(self, now):
         wifi_icon = '\uf1eb'
         net_icon = '\uf0e8'  # (this is actually the sitemap icon)
         vpn_icon = '\uf023'  # lock icon, try to find a better one later
-        stats = psutil.net_if_stats()
-        default_gateway_interface = self._get_default_gateway_interface()
+        default_gateway_interface, stats, all_addrs = self._network_state()
         for k, interface in stats.items():
             if k == default_gateway_interface or (
                     not default_gateway_interface and interface.isup):
-                addrs = psutil.net_if_addrs()[k]
-                download, upload = self._compute_nic_throughput(k, now)
+                addrs = all_addrs[k]
+                download, upload = (self._compute_nic_throughput(k, now)
+                        or ('?', '?'))
                 return {
                     'name': 'network',
                     'markup': 'pango',
@@ -140,10 +633,13 @@ class HubStatus(object):
                 }
 
     def _battery(self, now):
-        b = psutil.sensors_battery()
+        if self._battery_collector:
+            b = self._battery_collector.state()
+        else:
+            b = psutil.sensors_battery()
         if not b:
             return None
-            color = '#ffcc00'
+        self._on_battery = not b.power_plugged
         if b.percent > 75:
             icon = '\uf240' 
             color = 'green'
@@ -187,44 +683,179 @@ class HubStatus(object):
     async def on_i3bar_resume(self, event, arg):
         pass
 
-    @listen('i3hub::i3bar_click')
-    async def on_i3bar_click(self, event, arg):
-        pass
+    @listen('i3::shutdown')
+    @listen('i3hub::unload')
+    async def on_shutdown(self, event, arg):
+        for timer in self._timers.values():
+            timer.cancel()
+        if self._pending_handle:
+            self._pending_handle.cancel()
+        for monitor in (self._route_monitor, self._uevent_monitor):
+            if monitor:
+                monitor.close()
+        if self._executor:
+            # probes read the collector files, wait for running probes before
+            # closing them
+            shutdown = self._loop.run_in_executor(None,
+                    self._executor.shutdown)
+            try:
+                await asyncio.wait_for(shutdown, self._probe_timeout)
+            except asyncio.TimeoutError:
+                logger.warning('probes still running, not closing files')
+                return
+        self._close_files()
+
+    def _close_files(self):
+        for collector in (self._cpu_collector, self._memory_collector,
+                self._net_dev_collector, self._battery_collector):
+            if collector:
+                collector.close()
+        self._cpu_collector = None
+        self._memory_collector = None
+        self._net_dev_collector = None
+        self._battery_collector = None
+        if self._proc_net_route:
+            self._proc_net_route.close()
+            self._proc_net_route = None
 
     @listen('i3hub::init')
     async def init(self, event, arg):
-        self._disabled_widgets = arg['config'].get('disable', [])
-        self._loop.create_task(self.run())
+        config = arg['config']
+        self._disabled_widgets = config.get('disable', [])
+        self._probe_timeout = config.get('probe_timeout', PROBE_TIMEOUT)
+        self._history_size = config.get('history_size', HISTORY_SIZE)
+        self._ewma_alpha = config.get('ewma_alpha', EWMA_ALPHA)
+        self._sparklines = frozenset(config.get('sparklines', []))
+        self._on_battery_factor = config.get('on_battery_factor',
+                ON_BATTERY_FACTOR)
+        if config.get('native_collectors', True):
+            self._setup_collectors()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=config.get('probe_workers', PROBE_WORKERS))
+        if config.get('netlink', True):
+            self._setup_monitors()
+        await self._probe('baseline', self._baseline, datetime.datetime.now())
+        # all widgets share the hub timer wheel, so widgets that are due in
+        # the same second result in a single i3bar refresh
+        modules = self._get_modules()
+        self._widget_order = dict((f.__name__[1:], i) for (i, (f, _)) in
+                enumerate(reversed(modules)))
+        intervals = config.get('intervals', {})
+        for module, bounds in modules:
+            name = module.__name__[1:]
+            if name == 'battery':
+                self._battery_poll_bounds = interval_bounds(name,
+                        intervals.get(name), bounds)
+                if self._uevent_monitor:
+                    bounds = (BATTERY_EVENT_INTERVAL, BATTERY_EVENT_INTERVAL)
+            minimum, maximum = interval_bounds(name, intervals.get(name),
+                    bounds)
+            self._intervals[name] = [minimum, maximum, minimum]
+            self._updaters[name] = self._updater(module)
+            self._timers[name] = self._i3.every(minimum, self._updaters[name])
 
     def _get_modules(self):
+        # (widget, (minimum interval, maximum interval))
         all_modules = [
-            (self._date, 5),
-            (self._battery, 30),
-            (self._network, 10),
-            (self._cpu, 5),
-            (self._memory, 5),
-            (self._disk, 30),
+            (self._date, (5, 5)),
+            (self._battery, (30, 300)),
+            (self._network, (10, 60)),
+            (self._cpu, (5, 30)),
+            (self._memory, (5, 30)),
+            (self._disk, (30, 300)),
         ]
         return [(f, i) for (f, i) in all_modules
                 if f.__name__[1:] not in self._disabled_widgets]
 
-    async def run(self):
-        modules = self._get_modules()
+    def _changed(self, name, last, result):
+        value = self._values.pop(name, None)
+        if value is None:
+            return not (last and result) or (
+                    last['full_text'] != result['full_text'])
+        reference = self._reference_values.get(name)
+        if reference is None:
+            changed = True
+        elif name == 'network':
+            # relative to the rate, ignoring anything below 1K/s
+            changed = abs(value - reference) > NETWORK_CHANGE * max(
+                    reference, KB)
+        elif name == 'memory':
+            changed = abs(value - reference) > MEMORY_CHANGE
+        else:
+            changed = abs(value - reference) > CPU_CHANGE
+        if changed:
+            self._reference_values[name] = value
+        return changed
+
+    def _adapt_interval(self, name, changed):
+        bounds = self._intervals[name]
+        minimum, maximum, interval = bounds
+        if changed:
+            interval = minimum
+        else:
+            interval = min(interval * 2, maximum)
+        bounds[2] = interval
+        if self._on_battery:
+            interval *= self._on_battery_factor
+        self._timers[name].set_interval(interval)
 
-        def check(first_run):
+    def _stale(self, name):
+        last = self._last_blocks.get(name)
+        if not last:
+            return {'name': name, 'markup': 'none', 'full_text': '?'}
+        return dict(last, color=STALE_COLOR)
+
+    async def _probe(self, name, module, now):
+        # returns the widget block and whether it is fresh
+        future = self._probes.get(name)
+        if future is None:
+            # only one call per probe can be in flight: if a previous call is
+            # still hung, wait for it again instead of piling up threads
+            future = self._loop.run_in_executor(self._executor, module, now)
+            self._probes[name] = future
+            def done(f):
+                if self._probes.get(name) is f:
+                    del self._probes[name]
+            future.add_done_callback(done)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future),
+                    self._probe_timeout)
+        except asyncio.TimeoutError:
+            logger.warning('probe "%s" timed out', name)
+            return self._stale(name), False
+        except Exception as e:
+            logger.warning('probe "%s" failed: %s', name, e)
+            return self._stale(name), False
+        return result, True
+
+    def _updater(self, module):
+        name = module.__name__[1:]
+        async def update():
             now = datetime.datetime.now()
-            rv = False
-            for module, update_frequency in modules:
-                if first_run or now.second % update_frequency == 0:
-                    result = module(now)
-                    if result:
-                        status_array_merge(self._current_status, result)
-                        rv = True
-            return rv
-
-        check(True)
-        self._i3.refresh_i3bar()
-        while True:
-            await asyncio.sleep(1)
-            if check(False):
-                self._i3.refresh_i3bar()
+            last = self._last_blocks.get(name)
+            if name in INLINE_WIDGETS:
+                result, fresh = module(now), True
+            else:
+                result, fresh = await self._probe(name, module, now)
+            if fresh:
+                if result:
+                    self._last_blocks[name] = result
+                if name in self._timers:
+                    self._adapt_interval(name, self._changed(name, last,
+                        result))
+            if result:
+                self._set_block(result)
+                return True
+            return False
+        return update
+
+    def _set_block(self, block):
+        # blocks are replaced instead of merged, so keys of a stale block
+        # (eg: its color) don't stick after the widget recovers
+        for i, current in enumerate(self._current_status):
+            if current['name'] == block['name']:
+                self._current_status[i] = block
+                return
+        self._current_status.append(block)
+        # probes can complete in any order, keep widgets sorted
+        self._current_status.sort(key=lambda b: self._widget_order[b['name']])
@@ -1,7 +1,13 @@
 # Simple extension that allows switching keyboard layouts with setxkbmap . If
 # i3hub is running as a i3 bar command, the extension will also display a
 # widget in the bar.
-from i3hub import extension, listen, status_array_merge
+import logging
+import shlex
+
+from i3hub import click, extension, listen, nop, status_array_merge
+
+
+logger = logging.getLogger(__name__)
 
 
 @extension()
@@ -23,30 +29,34 @@ class KeyboardLayoutSwitcher(object):
             })
 
     async def _switch_layout(self):
-        self._current_layout = (self._current_layout + 1) % len(self._layouts)
-        new_layout = self._layouts[self._current_layout]
-        await self._i3.command('exec setxkbmap {} {}'.format(new_layout,
-            self._extra_xkb_opts))
+        index = (self._current_layout + 1) % len(self._layouts)
+        try:
+            setxkbmap = await self._i3.spawn('setxkbmap', self._layouts[index],
+                    *shlex.split(self._extra_xkb_opts))
+        except OSError as e:
+            # keep showing the current layout
+            logger.error('failed to run setxkbmap: %s', e)
+            return
+        self._current_layout = index
+        await setxkbmap.wait()
         self._i3.refresh_i3bar()
 
     @listen('i3hub::init')
     async def on_init(self, event, arg):
-        self._i3.require('nop_binding')
-
         config = arg['config']
         self._layouts = config.get('layouts', ['us'])
         self._extra_xkb_opts = config.get('extra-xkb-opts', '')
         await self._switch_layout()
 
-    @listen('i3hub::i3bar_click')
+    @click('keyboard_layout')
     async def on_i3bar_click(self, event, payload):
-        if payload['name'] == 'keyboard_layout':
-            await self._switch_layout()
+        await self._switch_layout()
 
     @listen('i3hub::i3bar_refresh')
     async def on_i3bar_refresh(self, event, status_array):
-        self._merge(status_array)
+        if self._current_layout >= 0:
+            self._merge(status_array)
 
-    @listen('extension::nop-binding::switch-layout')
+    @nop('switch-layout')
     async def on_binding(self, event, args):
         await self._switch_layout()
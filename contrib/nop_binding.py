@@ -1,3 +1,6 @@
+# Emits "extension::nop-binding::<verb>" events for "nop <verb>" bindings.
+# New extensions should use the @nop decorator instead, which is routed by
+# i3hub without going through the generic event dispatch.
 import shlex
 
 from i3hub import listen
@@ -7,7 +10,11 @@ from i3hub import listen
 async def on_binding(i3, event, arg):
     if arg['change'] != 'run':
         return
-    argv = shlex.split(arg['binding']['command'])
+    command = arg['binding']['command']
+    if not command.lstrip().startswith('nop'):
+        # cheap check to avoid parsing commands that can't be nop bindings
+        return
+    argv = shlex.split(command)
     if argv[0] != 'nop' or len(argv) < 2:
         return
     await i3.emit_event('nop-binding::{}'.format(argv[1]), argv[2:])
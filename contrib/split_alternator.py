@@ -4,12 +4,42 @@
 #
 #       [split_alternator]
 #       workspaces = ["1", "2", "3"]
-# 
+#
 # On i3 configuration It is possible to configure a key to toggle this
 # functionality at runtime:
 #
 #       bindsym Mod1+a nop toggle-split-alternator
-from i3hub import extension, listen
+#
+# When a window is focused, the split orientation is chosen from its
+# dimensions: wide windows are split horizontally and tall windows
+# vertically. The layout of each container's parent is cached from the i3 tree,
+# so a command is only sent when the orientation actually has to change.
+# While no workspace is enabled, window events are suspended.
+import re
+
+from i3hub import extension, listen, nop
+
+
+# window changes that modify the tree structure
+TREE_CHANGES = ('new', 'close', 'move', 'floating')
+# commands run by bindings that can change the layout of a container's parent
+# without generating window events
+TREE_COMMANDS = frozenset(['split', 'layout', 'move', 'kill', 'floating',
+    'swap', 'scratchpad', 'append_layout'])
+CRITERIA = re.compile(r'\[[^\]]*\]')
+SPLIT_COMMANDS = {
+    'splith': 'split horizontal',
+    'splitv': 'split vertical',
+}
+
+
+def changes_tree(command):
+    # criteria can contain separators, remove them before splitting
+    for part in re.split('[;,]', CRITERIA.sub('', command)):
+        words = part.split()
+        if words and words[0] in TREE_COMMANDS:
+            return True
+    return False
 
 
 @extension()
@@ -18,27 +48,74 @@ class SplitAlternator(object):
         self._i3 = i3
         self._enabled_workspaces = None
         self._current_workspace = None
+        self._parent_layouts = None
+        self._window_suspended = False
 
-    @listen('i3hub::init')
-    async def on_init(self, event, arg):
-        self._i3.require('nop_binding')
+    async def _update_window_interest(self):
+        suspend = not self._enabled_workspaces
+        if suspend == self._window_suspended:
+            return
+        self._window_suspended = suspend
+        if suspend:
+            self._i3.suspend_event('window')
+        else:
+            await self._i3.resume_event('window')
 
-        config = arg['config']
-        self._enabled_workspaces = set(config.get('workspaces', []))
+    def _invalidate_tree(self):
+        self._parent_layouts = None
+
+    def _index_tree(self, node, index):
+        for child in node.get('nodes', []):
+            index[child['id']] = node.get('layout')
+            self._index_tree(child, index)
+
+    async def _get_parent_layout(self, con_id):
+        if self._parent_layouts is None:
+            index = {}
+            self._index_tree(await self._i3.get_tree(), index)
+            self._parent_layouts = index
+        return self._parent_layouts.get(con_id)
+
+    async def _update_current_workspace(self):
         for workspace in await self._i3.get_workspaces():
             if workspace['focused']:
                 self._current_workspace = workspace['name']
                 break
 
-    @listen('extension::nop-binding::toggle-split-alternator')
+    @listen('i3hub::init')
+    async def on_init(self, event, arg):
+        config = arg['config']
+        self._enabled_workspaces = set(config.get('workspaces', []))
+        await self._update_current_workspace()
+        await self._update_window_interest()
+
+    @listen('i3hub::reconnected')
+    async def on_reconnected(self, event, arg):
+        # i3 restarted in place, container ids may have changed
+        self._invalidate_tree()
+        await self._update_current_workspace()
+
+    @nop('toggle-split-alternator')
     async def on_toggle(self, event, arg):
         if self._current_workspace in self._enabled_workspaces:
             self._enabled_workspaces.remove(self._current_workspace)
         else:
             self._enabled_workspaces.add(self._current_workspace)
+        # tree changes were missed while window events were suspended
+        self._invalidate_tree()
+        await self._update_window_interest()
+
+    @listen('i3::binding')
+    async def on_binding(self, event, arg):
+        # user commands (eg: "layout tabbed" or "split v") don't generate
+        # window events but can change the tree. Focus bindings are the most
+        # common and don't, so they keep the cache.
+        if changes_tree(arg['binding']['command']):
+            self._invalidate_tree()
 
     @listen('i3::workspace')
     async def on_workspace(self, event, arg):
+        self._invalidate_tree()
         if arg['change'] == 'focus':
             self._current_workspace = arg['current']['name']
         elif arg['change'] == 'init':
@@ -46,7 +123,20 @@ class SplitAlternator(object):
 
     @listen('i3::window')
     async def on_window(self, event, arg):
+        change = arg['change']
+        if change in TREE_CHANGES:
+            self._invalidate_tree()
+            return
         container = arg['container']
-        if (arg['change'] == 'focus' and container['type'] == 'con' and
+        if not (change == 'focus' and container['type'] == 'con' and
                 self._current_workspace in self._enabled_workspaces):
-            await self._i3.command('split toggle')
+            return
+        rect = container['rect']
+        desired = 'splith' if rect['width'] > rect['height'] else 'splitv'
+        current = await self._get_parent_layout(container['id'])
+        if current not in SPLIT_COMMANDS or current == desired:
+            # either the parent is tabbed/stacked or nothing needs to change
+            return
+        await self._i3.command('[con_id={}] {}'.format(container['id'],
+            SPLIT_COMMANDS[desired]))
+        self._invalidate_tree()
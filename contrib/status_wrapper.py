@@ -1,15 +1,107 @@
+# Wraps one or more i3bar status commands (eg: i3status). The blocks of all
+# commands are merged in the configured order, and click events are forwarded
+# to the command that owns the clicked block:
+#
+#     [status_wrapper]
+#     status-commands = [["i3status"], ["my-status-script", "--blocks"]]
+#
+# `status-command` can still be used to wrap a single command.
 import asyncio
 import json
+import logging
 import signal
 
-from i3hub import extension, listen, STOP_SIGNAL, CONT_SIGNAL
+from i3hub import extension, listen, RawBlocks, STOP_SIGNAL, CONT_SIGNAL
 
 
-# i3 will send stop/cont signals to the process group. use preexec_fn to ensure
-# the child status process ignores i3hub's own STOP/CONT signal numbers.
-def ignore_sigs():
-    signal.signal(STOP_SIGNAL, signal.SIG_IGN)
-    signal.signal(CONT_SIGNAL, signal.SIG_IGN)
+logger = logging.getLogger(__name__)
+
+# wait a little before refreshing so updates from multiple commands that
+# happen at the same time result in a single frame
+COALESCE_DELAY = 0.01
+
+
+class StatusCommand(object):
+    def __init__(self, command, spawn, updated_cb):
+        self._command = command
+        self._spawn = spawn
+        self._updated_cb = updated_cb
+        self._proc = None
+        self._last_line = None
+        self._clicks_sent = 0
+        self.supports_click = False
+        self.stop_sig = None
+        self.cont_sig = None
+        self.blocks = None
+
+    def owns(self, click):
+        if not self.blocks:
+            return False
+        for block in self.blocks.blocks:
+            if (block.get('name') == click.get('name') and
+                    block.get('instance') == click.get('instance')):
+                return True
+        return False
+
+    def send_signal(self, sig):
+        if self._proc and self._proc.returncode is None:
+            self._proc.send_signal(sig)
+
+    def send_click(self, click):
+        # click events are sent as an infinite JSON array, just like i3bar
+        if self._clicks_sent:
+            prefix = b','
+        else:
+            prefix = b'[\n'
+        self._clicks_sent += 1
+        self._proc.stdin.write(prefix + json.dumps(click).encode('utf-8') +
+                b'\n')
+
+    async def terminate(self):
+        if self._proc and self._proc.returncode is None:
+            self._proc.terminate()
+            await self._proc.wait()
+
+    async def _read_status(self):
+        line = await self._proc.stdout.readline()
+        if not line:
+            return False
+        if line == self._last_line:
+            # nothing changed, no need to refresh
+            return True
+        self._last_line = line
+        data = line.strip()
+        if data[:1] == b',':
+            data = data[1:].lstrip()
+        if not (data[:1] == b'[' and data[-1:] == b']'):
+            logger.warning('invalid status line: %s', line)
+            return True
+        # the blocks are passed to i3bar without being decoded, unless another
+        # extension needs to modify them
+        self.blocks = RawBlocks(data)
+        self._updated_cb()
+        return True
+
+    async def run(self):
+        # i3 will send stop/cont signals to the process group, ensure the
+        # child status process ignores i3hub's own STOP/CONT signal numbers.
+        self._proc = await self._spawn(*self._command,
+                stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+                ignore_signals=(STOP_SIGNAL, CONT_SIGNAL))
+        # read first line with information about the status program
+        info = json.loads((await self._proc.stdout.readline()).decode(
+                'utf-8', 'replace').strip())
+        # detect if the underlying status command supports click events
+        self.supports_click = info.get('click_events', False)
+        # detect the stop/cont signals
+        self.stop_sig = info.get('stop_signal', signal.SIGSTOP)
+        self.cont_sig = info.get('cont_signal', signal.SIGCONT)
+        # ignore second line line with opening bracket
+        await self._proc.stdout.readline()
+        # dispatch initial status state
+        status_read = await self._read_status()
+        while status_read:
+            status_read = await self._read_status()
 
 
 @extension()
@@ -19,75 +111,67 @@ class Status(object):
     def __init__(self, i3):
         self._i3 = i3
         self._loop = i3.event_loop
-        self._command = None
-        self._proc = None
-        self._status_supports_click = None
-        self._status_array = []
-        self._stop_sig = None
-        self._cont_sig = None
-        self._updating = False
+        self._commands = []
+        self._refresh_handle = None
 
-    async def _read_status(self):
-        line = await self._proc.stdout.readline()
-        if not line:
-            return False
-        line = line.decode('utf-8', 'replace').strip()
-        if line[0] == ',':
-            line = line[1:]
-        self._status_array = json.loads(line)
+    def _updated(self):
+        if not self._refresh_handle:
+            self._refresh_handle = self._loop.call_later(COALESCE_DELAY,
+                    self._refresh)
+
+    def _refresh(self):
+        self._refresh_handle = None
         self._i3.refresh_i3bar()
-        return True
 
     @listen('i3hub::i3bar_refresh')
     async def on_i3bar_refresh(self, event, status_array):
-        status_array.extend(self._status_array)
+        for command in self._commands:
+            if command.blocks:
+                status_array.append_raw(command.blocks)
 
     @listen('i3hub::i3bar_suspend')
     async def on_i3bar_suspend(self, event, arg):
-        self._proc.send_signal(self._stop_sig)
+        for command in self._commands:
+            command.send_signal(command.stop_sig)
 
     @listen('i3hub::i3bar_resume')
     async def on_i3bar_resume(self, event, arg):
-        self._proc.send_signal(self._cont_sig)
+        for command in self._commands:
+            command.send_signal(command.cont_sig)
 
     @listen('i3hub::i3bar_click')
     async def on_i3bar_click(self, event, arg):
-        click_payload = [arg]
-        if self._status_supports_click:
-            # Only need to emit this event if the underlying status command
-            # supports click events
+        if not isinstance(arg, dict):
+            return
+        for command in self._commands:
+            if not command.owns(arg):
+                continue
+            if not command.supports_click:
+                # Only need to emit this event if the underlying status
+                # command supports click events
+                break
+            click_payload = [arg]
             await self._i3.emit_event('status_wrapper::intercept_i3bar_click',
                     click_payload)
             if click_payload:
                 # if no extension deleted the payload, forward the click
-                self._proc.stdin.write(json.dumps(click_payload[0]).encode(
-                    'utf-8'))
+                command.send_click(click_payload[0])
+            break
 
     @listen('i3::shutdown')
+    @listen('i3hub::unload')
     async def shutdown(self, event, arg):
-        self._proc.terminate()
-        await self._proc.wait()
+        if self._refresh_handle:
+            self._refresh_handle.cancel()
+        await asyncio.gather(*(c.terminate() for c in self._commands))
 
     @listen('i3hub::init')
     async def init(self, event, arg):
-        self._command = arg['config'].get('status-command', ['i3status'])
-        self._loop.create_task(self.run())
-
-    async def run(self):
-        self._proc = await asyncio.create_subprocess_exec(*self._command,
-                stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
-                preexec_fn=ignore_sigs)
-        # read first line with information about the status program
-        info = json.loads((await self._proc.stdout.readline()).decode(
-                'utf-8', 'replace').strip())
-        # detect if the underlying status command supports click events
-        self._status_supports_click = info.get('click_events', False)
-        # detect the stop/cont signals
-        self._stop_sig = info.get('stop_signal', signal.SIGSTOP)
-        self._cont_sig = info.get('cont_signal', signal.SIGCONT)
-        # ignore second line line with opening bracket
-        await self._proc.stdout.readline()
-        # dispatch initial status state
-        status_read = await self._read_status()
-        while status_read:
-            status_read = await self._read_status()
+        config = arg['config']
+        commands = config.get('status-commands', None)
+        if commands is None:
+            commands = [config.get('status-command', ['i3status'])]
+        self._commands = [StatusCommand(c, self._i3.spawn,
+            self._updated) for c in commands]
+        for command in self._commands:
+            self._loop.create_task(command.run())
@@ -1,11 +1,106 @@
+# Runs i3 commands when a configured workspace is initialized. Commands can
+# wait for the window of a launched application before proceeding, optionally
+# matching the window class, instance or title (regular expressions):
+#
+#     [workspace_master]
+#     workspaces = {
+#         "web": {
+#           "commands": [
+#             "exec firefox",
+#             "[wait-for-window class=\"^firefox$\"]",
+#             "split vertical",
+#             "exec urxvt",
+#             "[wait-for-window instance=\"^urxvt$\" timeout=5]"
+#           ]
+#         }
+#       }
+#
+# Consecutive commands are sent to i3 in a single message. Consecutive
+# "exec" commands that are each followed by a wait with criteria are launched
+# together and their windows are awaited in parallel. Waits without criteria
+# match any new window and are always run one at a time.
 import asyncio
+import logging
 import re
-import sys
 
-from i3hub import extension, listen 
+from i3hub import extension, listen, nop
 
 
-EXEC_PATTERN = re.compile('^exec\s+')
+logger = logging.getLogger(__name__)
+
+EXEC_PATTERN = re.compile(r'^exec\s+')
+WAIT_PATTERN = re.compile(r'^\[wait-for-window(?P<criteria>[^\]]*)\]$')
+CRITERIA_PATTERN = re.compile(r'(\w+)=(?:"([^"]*)"|(\S+))')
+WINDOW_CRITERIA = ('class', 'instance', 'title')
+WAIT_TIMEOUT = 5
+
+
+def parse_wait(cmd):
+    # returns (criteria, timeout) if `cmd` is a wait-for-window command
+    m = WAIT_PATTERN.match(cmd)
+    if not m:
+        return None
+    criteria = {}
+    timeout = None
+    for key, quoted, plain in CRITERIA_PATTERN.findall(m.group('criteria')):
+        value = quoted or plain
+        if key == 'timeout':
+            timeout = float(value)
+        elif key in WINDOW_CRITERIA:
+            criteria[key] = re.compile(value)
+        else:
+            logger.warning('unknown wait-for-window criteria "%s"', key)
+    return criteria, timeout
+
+
+def plan_commands(commands):
+    # Groups commands into steps:
+    #   ('commands', [cmd, ...]): sent to i3 in a single message
+    #   ('launch', [(exec_cmd or None, wait), ...]): commands that are sent in
+    #   a single message, followed by waiting for all windows in parallel
+    steps = []
+    i = 0
+    while i < len(commands):
+        cmd = commands[i]
+        wait = parse_wait(cmd)
+        if wait:
+            steps.append(('launch', [(None, wait)]))
+            i += 1
+            continue
+        nxt = parse_wait(commands[i + 1]) if i + 1 < len(commands) else None
+        if EXEC_PATTERN.match(cmd) and nxt:
+            launch = [(cmd, nxt)]
+            i += 2
+            # independent launches (waits with criteria) run in parallel
+            while (nxt[0] and i + 1 < len(commands) and
+                    EXEC_PATTERN.match(commands[i])):
+                following = parse_wait(commands[i + 1])
+                if not (following and following[0]):
+                    break
+                launch.append((commands[i], following))
+                i += 2
+            steps.append(('launch', launch))
+            continue
+        if steps and steps[-1][0] == 'commands':
+            steps[-1][1].append(cmd)
+        else:
+            steps.append(('commands', [cmd]))
+        i += 1
+    return steps
+
+
+class WindowWaiter(object):
+    def __init__(self, criteria):
+        self.criteria = criteria
+        self.future = asyncio.Future()
+
+    def matches(self, container):
+        properties = container.get('window_properties') or {}
+        for key, pattern in self.criteria.items():
+            if not pattern.search(properties.get(key) or ''):
+                return False
+        return True
+
 
 @extension()
 class WorkspaceMaster(object):
@@ -13,13 +108,15 @@ class WorkspaceMaster(object):
         self._i3 = i3
         self._loop = i3.event_loop
         self._workspaces = None
-        self._wait_future = None
+        self._wait_timeout = WAIT_TIMEOUT
+        self._waiters = []
+        # setups in progress, mapped to the workspace being set up
+        self._aborts = {}
 
     @listen('i3hub::init')
     async def on_init(self, event, arg):
-        self._i3.require('nop_binding')
-
         config = arg['config']
+        self._wait_timeout = config.get('wait-timeout', WAIT_TIMEOUT)
         self._workspaces = {}
         for k, v in config.get('workspaces', {}).items():
             directory = v.get('directory', None)
@@ -38,22 +135,78 @@ class WorkspaceMaster(object):
                             cmd[len(prefix):])
                 self._workspaces[k]['commands'].append(cmd)
 
-    async def _run_workspace_commands(self, workspace):
-        for cmd in workspace['commands']:
-            if cmd == '[wait-for-window]':
-                f = asyncio.Future()
-                self._wait_future = f
-                await asyncio.wait([self._wait_future], timeout=1)
-                if f.done() and f.result():
-                    break
+    async def _send_commands(self, commands):
+        # commands that contain separators can't be safely chained, they are
+        # sent alone, keeping the order of all commands
+        messages = []
+        chained = []
+        for cmd in commands:
+            if ';' not in cmd and ',' not in cmd:
+                chained.append(cmd)
                 continue
-            reply = await self._i3.command(cmd)
-            if not reply[0]['success']:
-                print('failed to execute', cmd, file=sys.stderr)
+            if chained:
+                messages.append('; '.join(chained))
+                chained = []
+            messages.append(cmd)
+        if chained:
+            messages.append('; '.join(chained))
+        for message in messages:
+            for reply in await self._i3.command(message):
+                if not reply['success']:
+                    logger.error('failed to execute %s', message)
+
+    def _add_waiters(self, waits):
+        waiters = [WindowWaiter(criteria) for criteria, _ in waits]
+        self._waiters.extend(waiters)
+        return waiters
+
+    async def _wait_windows(self, waiters, waits, abort):
+        timeouts = [t for _, t in waits if t is not None]
+        timeout = max(timeouts) if timeouts else self._wait_timeout
+        deadline = self._loop.time() + timeout
+        try:
+            while not abort.done():
+                pending = [w.future for w in waiters if not w.future.done()]
+                remaining = deadline - self._loop.time()
+                if not pending or remaining <= 0:
+                    break
+                await asyncio.wait(pending + [abort], timeout=remaining,
+                        return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self._remove_waiters(waiters)
 
-    @listen('extension::nop-binding::select-workspace')
+    def _remove_waiters(self, waiters):
+        for waiter in waiters:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            waiter.future.cancel()
+
+    async def _run_workspace_commands(self, name, workspace):
+        abort = asyncio.Future()
+        self._aborts[abort] = name
+        try:
+            for kind, items in plan_commands(workspace['commands']):
+                if kind == 'commands':
+                    await self._send_commands(items)
+                    continue
+                # register the waiters before launching, so windows that
+                # appear before the reply can't be missed
+                waits = [wait for _, wait in items]
+                waiters = self._add_waiters(waits)
+                try:
+                    await self._send_commands([c for c, _ in items if c])
+                except Exception:
+                    self._remove_waiters(waiters)
+                    raise
+                await self._wait_windows(waiters, waits, abort)
+                if abort.done():
+                    break
+        finally:
+            del self._aborts[abort]
+
+    @nop('select-workspace')
     async def on_select_workspace(self, event, arg):
-        rofi = await asyncio.create_subprocess_exec('rofi', '-p',
+        rofi = await self._i3.spawn('rofi', '-p',
                 'Select workspace ', '-dmenu', stdin=asyncio.subprocess.PIPE,
                 stdout=asyncio.subprocess.PIPE)
         active_workspaces = map(lambda w: w['name'],
@@ -73,21 +226,29 @@ class WorkspaceMaster(object):
 
     @listen('i3::window')
     async def on_window(self, event, arg):
-        if arg['change'] == 'focus' and self._wait_future:
-            self._wait_future.set_result(False)
-            self._wait_future = None
+        if arg['change'] != 'new':
+            return
+        for waiter in self._waiters:
+            if not waiter.future.done() and waiter.matches(arg['container']):
+                waiter.future.set_result(arg['container'])
+                break
 
     @listen('i3::workspace')
     async def on_workspace(self, event, arg):
-        if self._wait_future:
-            # stop running setup commands for workspace
-            self._wait_future.set_result(True)
-            self._wait_future = None
+        name = arg['current']['name']
+        if arg['change'] == 'focus':
+            # the user moved to another workspace, stop running setup
+            # commands since they would be applied to the wrong workspace. i3
+            # also sends focus for the workspace being set up after init.
+            for abort, workspace in self._aborts.items():
+                if workspace != name and not abort.done():
+                    abort.set_result(None)
         if arg['change'] != 'init':
             # only run when workspace is initializing
             return
-        workspace = self._workspaces.get(arg['current']['name'], None)
+        workspace = self._workspaces.get(name, None)
         if workspace:
             # run commands in a separate task, since there's the possibility of
             # long blocking due to waiting for windows to spawn
-            self._loop.create_task(self._run_workspace_commands(workspace))
+            self._loop.create_task(self._run_workspace_commands(name,
+                workspace))
@@ -1,32 +1,39 @@
 #!/usr/bin/env python3
 
-import argparse
+# modules that are only needed by the command line entry point (argparse,
+# configparser, xdg) or in fallback paths (subprocess) are imported where they
+# are used, so importing i3hub stays cheap
+import array
 import asyncio
+import codecs
 import collections
-import configparser
-import glob
+import heapq
 import json
 import importlib.util
 import inspect
+import logging
 import os
-import pkgutil
+import re
+import shlex
 import signal
+import socket
 import struct
-import subprocess
 import sys
+import threading
+import time
 
-
-from xdg.BaseDirectory import (
-        xdg_config_home,
-        load_data_paths,
-        load_config_paths,
-        get_runtime_dir)
+from types import MappingProxyType
 
 
 JSON_SEPS = (',', ':')
+KB = 1024
+MB = 1024 * KB
+EMPTY_SECTION = MappingProxyType({})
 STOP_SIGNAL = signal.SIGRTMAX
 CONT_SIGNAL = signal.SIGRTMAX - 1
 
+logger = logging.getLogger('i3hub')
+
 
 MESSAGES = (
     ('command', lambda cmd_str: cmd_str),
@@ -54,8 +61,12 @@ I3_EVENTS = (
     'tick',
 )
 
+SCROLL_BUTTONS = (4, 5, 6, 7)
+
 HUB_EVENTS = (
     'init',
+    'unload',
+    'reconnected',
     'i3bar_click',
     'i3bar_refresh',
     'i3bar_suspend',
@@ -63,16 +74,6 @@ HUB_EVENTS = (
 )
 
 
-class JSONInterpolation(configparser.ExtendedInterpolation):
-    def before_get(self, parser, section, option, value, defaults):
-        interpolated = super().before_get(parser, section, option, value,
-                defaults)
-        try:
-            return json.loads(interpolated)
-        except json.JSONDecodeError:
-            return interpolated
-
-
 class I3ConnectionMeta(type):
     def __new__(cls, clsname, superclasses, attrs):
         def gen_method(msg_type, handler):
@@ -116,16 +117,24 @@ class I3Connection(object, metaclass=I3ConnectionMeta):
             future = asyncio.Future(loop=self._loop)
             self._send_queue.append(future)
             await future
+        if self._eof:
+            raise ConnectionResetError('The connection to i3 was closed')
         self._send_now(message_type, payload)
         self._reply = asyncio.Future(loop=self._loop)
         if not self._polling:
             self._loop.create_task(self._wait_reply())
-        payload = await self._reply
-        self._reply = None
-        if self._send_queue:
-            # allow the next message to be sent
-            self._send_queue.popleft().set_result(None)
-        return payload
+        try:
+            return await self._reply
+        finally:
+            self._reply = None
+            if self._send_queue:
+                # allow the next message to be sent
+                self._send_queue.popleft().set_result(None)
+
+    def _fail_reply(self):
+        if self._reply and not self._reply.done():
+            self._reply.set_exception(ConnectionResetError(
+                'The connection to i3 was closed'))
 
     async def _recv(self):
         assert not self._eof
@@ -152,6 +161,7 @@ class I3Connection(object, metaclass=I3ConnectionMeta):
         self._polling = False
         if msg_type == 'eof':
             self._event_queue.append(('eof', None))
+            self._fail_reply()
         elif is_event:
             self._event_queue.append((I3_EVENTS[msg_type], payload))
         else:
@@ -159,7 +169,8 @@ class I3Connection(object, metaclass=I3ConnectionMeta):
             self._reply.set_result(payload)
 
     async def _wait_reply(self):
-        while not self._reply.done():
+        reply = self._reply
+        while not reply.done() and not self._eof:
             await self._poll()
 
     async def wait_event(self):
@@ -168,8 +179,133 @@ class I3Connection(object, metaclass=I3ConnectionMeta):
         return self._event_queue.popleft()
 
     def close(self):
+        self._eof = True
+        self._fail_reply()
         self._writer.close()
 
+    async def close_when_idle(self):
+        # close after requests that were already sent are answered
+        while self._reply or self._send_queue:
+            try:
+                await asyncio.shield(self._reply)
+            except Exception:
+                pass
+            await asyncio.sleep(0)
+        self.close()
+
+
+class Timer(object):
+    def __init__(self, scheduler, interval, callback):
+        self._scheduler = scheduler
+        self.interval = interval
+        self.callback = callback
+        self.due = None
+        self.cancelled = False
+
+    def set_interval(self, interval):
+        if int(interval) != self.interval:
+            self._scheduler._reschedule(self, interval)
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler(object):
+    # Timer wheel shared by all extensions. Timers are bucketed by the
+    # wall-clock second in which they are due, so periodic callbacks that
+    # fall on the same second run in a single batch, followed by at most one
+    # i3bar refresh. The event loop only wakes up when a bucket is due.
+    def __init__(self, loop, refresh_cb):
+        self._loop = loop
+        self._refresh_cb = refresh_cb
+        self._buckets = {}
+        self._due_seconds = []
+        self._handle = None
+        self._handle_due = None
+
+    def every(self, interval, callback):
+        if interval < 1:
+            raise Exception('Timer intervals must be at least 1 second')
+        timer = Timer(self, int(interval), callback)
+        # new timers run in the next batch
+        self._add(timer, 0)
+        return timer
+
+    def _reschedule(self, timer, interval):
+        if interval < 1:
+            raise Exception('Timer intervals must be at least 1 second')
+        bucket = self._buckets.get(timer.due)
+        if bucket and timer in bucket:
+            bucket.remove(timer)
+        timer.interval = int(interval)
+        self._add(timer, (int(time.time()) // timer.interval + 1) *
+                timer.interval)
+
+    def _add(self, timer, due):
+        timer.due = due
+        bucket = self._buckets.get(due)
+        if bucket is None:
+            bucket = self._buckets[due] = []
+            heapq.heappush(self._due_seconds, due)
+        bucket.append(timer)
+        if self._handle_due is None or due < self._handle_due:
+            self._arm(due)
+
+    def _arm(self, due):
+        if self._handle:
+            self._handle.cancel()
+        delay = max(0, due - time.time())
+        self._handle_due = due
+        self._handle = self._loop.call_later(delay, self._tick)
+
+    def _tick(self):
+        self._handle = None
+        self._handle_due = None
+        # the loop clock is monotonic and can fire slightly before the wall
+        # clock crosses the second boundary, so allow some slack
+        second = int(time.time() + 0.01)
+        batch = []
+        while self._due_seconds and self._due_seconds[0] <= second:
+            batch.extend(self._buckets.pop(
+                heapq.heappop(self._due_seconds)))
+        batch = [timer for timer in batch if not timer.cancelled]
+        for timer in batch:
+            self._add(timer, (second // timer.interval + 1) * timer.interval)
+        if batch:
+            self._loop.create_task(self._run_batch(batch))
+        elif self._due_seconds:
+            self._arm(self._due_seconds[0])
+
+    async def _run_batch(self, batch):
+        results = []
+        coroutines = []
+        for timer in batch:
+            try:
+                rv = timer.callback()
+            except Exception as e:
+                logger.error('timer callback %s failed: %s', timer.callback, e)
+                continue
+            if asyncio.iscoroutine(rv):
+                coroutines.append(rv)
+            else:
+                results.append(rv)
+        if coroutines:
+            for rv in await asyncio.gather(*coroutines,
+                    return_exceptions=True):
+                if isinstance(rv, Exception):
+                    logger.error('timer callback failed: %s', rv)
+                else:
+                    results.append(rv)
+        if any(results):
+            self._refresh_cb()
+
+    def close(self):
+        if self._handle:
+            self._handle.cancel()
+            self._handle = None
+        self._buckets.clear()
+        del self._due_seconds[:]
+
 
 class I3ApiWrapperMeta(type):
     def __new__(cls, clsname, superclasses, attrs):
@@ -190,10 +326,15 @@ class I3ApiWrapperMeta(type):
 
 class I3ApiWrapper(object, metaclass=I3ApiWrapperMeta):
     def __init__(self, conn, refresh_i3bar_cb, emit_event_cb,
-            require_cb, runtime_dir):
+            require_cb, every_cb, suspend_event_cb, resume_event_cb, spawner,
+            runtime_dir):
         self._conn = conn
+        self._suspend_event_cb = suspend_event_cb
+        self._resume_event_cb = resume_event_cb
+        self._spawner = spawner
         self._shutting_down = False
         self._refresh_i3bar_cb = refresh_i3bar_cb
+        self._every_cb = every_cb
         self._emit_event_cb = emit_event_cb
         self._require_cb = require_cb
         self.runtime_dir = runtime_dir
@@ -208,116 +349,1177 @@ class I3ApiWrapper(object, metaclass=I3ApiWrapperMeta):
     def require(self, name):
         return self._require_cb(name)
 
+    def suspend_event(self, event):
+        # stop receiving an i3 event type (eg: "window"). Interest is tracked
+        # per extension: an extension starts interested in the events it
+        # listens to, suspending only withdraws the interest of the extension
+        # that owns this object, and i3 stops sending an event when no
+        # extension is interested anymore. Handlers can still be called while
+        # other extensions are interested.
+        return self._suspend_event_cb(event)
+
+    async def resume_event(self, event):
+        return await self._resume_event_cb(event)
+
+    def every(self, interval, callback):
+        # call `callback` every `interval` seconds, aligned to wall-clock
+        # second boundaries. If it returns (or resolves to) a true value, the
+        # i3bar is refreshed once for all callbacks in the same batch.
+        return self._every_cb(interval, callback)
+
+    async def spawn(self, *argv, **kwargs):
+        # start a child process. The keyword arguments are the same as
+        # asyncio.create_subprocess_exec (stdin, stdout, stderr, cwd and env),
+        # plus `ignore_signals`, a list of signals ignored by the child.
+        return await self._spawner.spawn(*argv, **kwargs)
+
+    @property
+    def spawn_stats(self):
+        return self._spawner.stats
+
     async def emit_event(self, event, arg):
         await self._emit_event_cb('extension::' + event, arg)
 
 
+class I3BarWriter(object):
+    # Writes status frames to i3bar without letting stale frames pile up in
+    # the transport buffer. When i3bar stops reading (eg: it was hidden or
+    # stopped), at most one frame is kept pending and it is replaced by newer
+    # frames until the pipe drains.
+    def __init__(self, loop, writer, high_water=64 * KB):
+        self._loop = loop
+        self._writer = writer
+        self._high_water = high_water
+        self._pending = None
+        self._draining = False
+        self._closed = False
+        self._first_frame = True
+        self.frames_written = 0
+        self.frames_superseded = 0
+        self.frames_dropped = 0
+        writer.transport.set_write_buffer_limits(high=high_water)
+
+    @property
+    def stats(self):
+        return {
+            'written': self.frames_written,
+            'superseded': self.frames_superseded,
+            'dropped': self.frames_dropped,
+            'pending': self._pending is not None,
+        }
+
+    def _buffer_full(self):
+        return (self._writer.transport.get_write_buffer_size() >
+                self._high_water)
+
+    def write_header(self, data):
+        self._writer.write(data)
+
+    def write_frame(self, frame):
+        if self._closed:
+            self.frames_dropped += 1
+            return False
+        if self._draining or self._buffer_full():
+            if self._pending is not None:
+                self.frames_superseded += 1
+            self._pending = frame
+            if not self._draining:
+                self._draining = True
+                self._loop.create_task(self._drain())
+            return False
+        if self._first_frame:
+            self._first_frame = False
+        else:
+            frame = b',' + frame
+        self._writer.write(frame)
+        self.frames_written += 1
+        return True
+
+    async def _drain(self):
+        try:
+            await self._writer.drain()
+        except ConnectionError:
+            self.close()
+        self._draining = False
+        frame, self._pending = self._pending, None
+        if frame is not None:
+            self.write_frame(frame)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._pending is not None:
+            self._pending = None
+            self.frames_dropped += 1
+
+
+def _exit_code(status):
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def _spawn_child(request, fds):
+    argv = request['argv']
+    err_r, err_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(err_r)
+            for target, fd in enumerate(fds):
+                os.dup2(fd, target)
+            signal.set_wakeup_fd(-1)
+            for sig in (signal.SIGCHLD, signal.SIGINT, signal.SIGPIPE,
+                    STOP_SIGNAL, CONT_SIGNAL):
+                signal.signal(sig, signal.SIG_DFL)
+            for sig in request.get('ignore_signals', []):
+                signal.signal(sig, signal.SIG_IGN)
+            if request.get('cwd'):
+                os.chdir(request['cwd'])
+            if request.get('env') is not None:
+                os.execvpe(argv[0], argv, request['env'])
+            os.execvp(argv[0], argv)
+        except BaseException as e:
+            os.write(err_w, json.dumps([getattr(e, 'errno', None),
+                str(e)]).encode('utf-8'))
+        finally:
+            os._exit(127)
+    os.close(err_w)
+    # the pipe is closed on exec, so this returns as soon as the child has
+    # either executed the program or failed to do so
+    error = b''
+    while True:
+        data = os.read(err_r, 4096)
+        if not data:
+            break
+        error += data
+    os.close(err_r)
+    if error:
+        os.waitpid(pid, 0)
+        errno, message = json.loads(error.decode('utf-8'))
+        return {'error': message, 'errno': errno}
+    return {'pid': pid}
+
+
+def _spawn_server_main(sock):
+    # Runs in the forked helper process. Spawn requests are received as
+    # SEQPACKET messages carrying the stdio file descriptors of the child.
+    # Replies are sent once the child has executed, and exit statuses are
+    # sent as children terminate.
+    import selectors
+    for sig in (signal.SIGINT, STOP_SIGNAL, CONT_SIGNAL):
+        signal.signal(sig, signal.SIG_IGN)
+    wakeup_r, wakeup_w = os.pipe()
+    os.set_blocking(wakeup_r, False)
+    os.set_blocking(wakeup_w, False)
+    signal.set_wakeup_fd(wakeup_w)
+    signal.signal(signal.SIGCHLD, lambda *args: None)
+    selector = selectors.DefaultSelector()
+    selector.register(sock, selectors.EVENT_READ)
+    selector.register(wakeup_r, selectors.EVENT_READ)
+    fds_size = socket.CMSG_SPACE(3 * struct.calcsize('i'))
+    while True:
+        for key, _ in selector.select():
+            if key.fileobj is sock:
+                try:
+                    msg, ancdata, _, _ = sock.recvmsg(65536, fds_size,
+                            socket.MSG_CMSG_CLOEXEC)
+                except InterruptedError:
+                    continue
+                if not msg:
+                    # the hub closed its end
+                    return
+                fds = array.array('i')
+                for level, kind, data in ancdata:
+                    if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                        fds.frombytes(data[:len(data) - (len(data) %
+                            fds.itemsize)])
+                try:
+                    reply = _spawn_child(json.loads(msg.decode('utf-8')),
+                            list(fds))
+                except Exception as e:
+                    reply = {'error': str(e), 'errno': None}
+                for fd in fds:
+                    os.close(fd)
+                sock.send(json.dumps(reply).encode('utf-8'))
+            else:
+                try:
+                    os.read(wakeup_r, 512)
+                except BlockingIOError:
+                    pass
+                while True:
+                    try:
+                        pid, status = os.waitpid(-1, os.WNOHANG)
+                    except ChildProcessError:
+                        break
+                    if pid == 0:
+                        break
+                    sock.send(json.dumps({'exited': pid,
+                        'returncode': _exit_code(status)}).encode('utf-8'))
+
+
+class SpawnedProcess(object):
+    # Child of the spawn server, with the same interface as
+    # asyncio.subprocess.Process
+    def __init__(self, spawner, pid, stdin, stdout, stderr):
+        self._spawner = spawner
+        self.pid = pid
+        self.stdin = stdin
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode = None
+        self._exit_future = asyncio.Future(loop=spawner._loop)
+
+    def _exited(self, returncode):
+        self.returncode = returncode
+        if not self._exit_future.done():
+            self._exit_future.set_result(returncode)
+
+    async def wait(self):
+        return await asyncio.shield(self._exit_future)
+
+    def send_signal(self, sig):
+        if self.returncode is None:
+            os.kill(self.pid, sig)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    async def communicate(self, input=None):
+        if self.stdin:
+            if input:
+                self.stdin.write(input)
+                await self.stdin.drain()
+            self.stdin.close()
+        stdout = stderr = None
+        if self.stdout:
+            stdout = await self.stdout.read()
+        if self.stderr:
+            stderr = await self.stderr.read()
+        await self.wait()
+        return stdout, stderr
+
+
+class Spawner(object):
+    # Spawns child processes for extensions. When the spawn server was
+    # started (ideally as early as possible, while the process is still
+    # small), children are forked from it instead of from the hub, which can
+    # be expensive once many extensions are loaded. Otherwise processes are
+    # created with asyncio.create_subprocess_exec.
+    def __init__(self):
+        self._loop = None
+        self._server_pid = None
+        self._sock = None
+        self._replies = collections.deque()
+        self._processes = {}
+        self._exited = {}
+        self._spawned = 0
+        self._total_latency = 0.0
+        self._last_latency = None
+        self._max_latency = 0.0
+
+    @property
+    def stats(self):
+        return {
+            'forkserver': self._sock is not None,
+            'spawned': self._spawned,
+            'last_latency': self._last_latency,
+            'mean_latency': (self._total_latency / self._spawned
+                if self._spawned else None),
+            'max_latency': self._max_latency,
+        }
+
+    def start_server(self):
+        parent_sock, child_sock = socket.socketpair(socket.AF_UNIX,
+                socket.SOCK_SEQPACKET)
+        pid = os.fork()
+        if pid == 0:
+            parent_sock.close()
+            try:
+                _spawn_server_main(child_sock)
+            finally:
+                os._exit(0)
+        child_sock.close()
+        self._server_pid = pid
+        self._sock = parent_sock
+
+    def attach(self, loop):
+        self._loop = loop
+        if self._sock:
+            self._sock.setblocking(False)
+            loop.add_reader(self._sock.fileno(), self._on_server_message)
+
+    def _stop_server(self):
+        if not self._sock:
+            return
+        self._loop.remove_reader(self._sock.fileno())
+        self._sock.close()
+        self._sock = None
+        while self._replies:
+            self._replies.popleft().set_exception(
+                    ConnectionError('spawn server stopped'))
+
+    def _on_server_message(self):
+        while self._sock:
+            try:
+                msg = self._sock.recv(65536)
+            except BlockingIOError:
+                return
+            except OSError:
+                msg = b''
+            if not msg:
+                logger.warning('spawn server exited, falling back to asyncio')
+                self._stop_server()
+                return
+            message = json.loads(msg.decode('utf-8'))
+            if 'exited' in message:
+                pid = message['exited']
+                process = self._processes.pop(pid, None)
+                if process:
+                    process._exited(message['returncode'])
+                else:
+                    self._exited[pid] = message['returncode']
+            else:
+                self._replies.popleft().set_result(message)
+
+    def _record_latency(self, started):
+        latency = self._loop.time() - started
+        self._spawned += 1
+        self._total_latency += latency
+        self._last_latency = latency
+        self._max_latency = max(self._max_latency, latency)
+
+    async def _spawn_server(self, argv, stdin, stdout, stderr, cwd, env,
+            ignore_signals):
+        child_fds = []
+        to_close = []
+        streams = []
+        def child_stdio(spec, target, readable):
+            if spec == asyncio.subprocess.PIPE:
+                r, w = os.pipe()
+                child, ours = (r, w) if readable else (w, r)
+                to_close.append(child)
+                child_fds.append(child)
+                streams.append((target, ours, readable))
+            elif spec == asyncio.subprocess.DEVNULL:
+                fd = os.open(os.devnull, os.O_RDWR | os.O_CLOEXEC)
+                to_close.append(fd)
+                child_fds.append(fd)
+            elif spec is None:
+                child_fds.append(target)
+            else:
+                child_fds.append(spec if isinstance(spec, int) else
+                        spec.fileno())
+        child_stdio(stdin, 0, True)
+        child_stdio(stdout, 1, False)
+        child_stdio(stderr, 2, False)
+        request = json.dumps({
+            'argv': list(argv),
+            'cwd': cwd,
+            'env': env,
+            'ignore_signals': [int(s) for s in ignore_signals],
+        }).encode('utf-8')
+        reply = asyncio.Future(loop=self._loop)
+        started = self._loop.time()
+        try:
+            self._sock.sendmsg([request], [(socket.SOL_SOCKET,
+                socket.SCM_RIGHTS, array.array('i', child_fds))])
+            self._replies.append(reply)
+            reply = await reply
+        except BaseException:
+            for _, fd, _ in streams:
+                os.close(fd)
+            raise
+        finally:
+            for fd in to_close:
+                os.close(fd)
+        if 'error' in reply:
+            for _, fd, _ in streams:
+                os.close(fd)
+            if reply['errno']:
+                raise OSError(reply['errno'], reply['error'])
+            raise OSError(reply['error'])
+        self._record_latency(started)
+        pipes = [None, None, None]
+        for target, fd, readable in streams:
+            if readable:
+                transport, protocol = await self._loop.connect_write_pipe(
+                        asyncio.streams.FlowControlMixin,
+                        os.fdopen(fd, 'wb', 0))
+                pipes[target] = asyncio.streams.StreamWriter(transport,
+                        protocol, None, self._loop)
+            else:
+                reader = asyncio.StreamReader(loop=self._loop)
+                await self._loop.connect_read_pipe(
+                        lambda: asyncio.StreamReaderProtocol(reader),
+                        os.fdopen(fd, 'rb', 0))
+                pipes[target] = reader
+        process = SpawnedProcess(self, reply['pid'], *pipes)
+        if reply['pid'] in self._exited:
+            process._exited(self._exited.pop(reply['pid']))
+        else:
+            self._processes[reply['pid']] = process
+        return process
+
+    async def spawn(self, *argv, stdin=None, stdout=None, stderr=None,
+            cwd=None, env=None, ignore_signals=()):
+        if self._sock:
+            return await self._spawn_server(argv, stdin, stdout, stderr, cwd,
+                    env, ignore_signals)
+        def preexec_fn():
+            # libuv based loops (uvloop) reset the disposition of the
+            # standard signals after this runs, only realtime signals (such
+            # as STOP_SIGNAL and CONT_SIGNAL) stay ignored on those
+            for sig in ignore_signals:
+                signal.signal(sig, signal.SIG_IGN)
+        started = self._loop.time()
+        process = await asyncio.create_subprocess_exec(*argv, stdin=stdin,
+                stdout=stdout, stderr=stderr, cwd=cwd, env=env,
+                preexec_fn=preexec_fn if ignore_signals else None)
+        self._record_latency(started)
+        return process
+
+    def close(self):
+        if not self._sock:
+            return
+        self._stop_server()
+        try:
+            os.waitpid(self._server_pid, 0)
+        except ChildProcessError:
+            pass
+
+
+class ClickEventDecoder(object):
+    # Incremental decoder for the click events sent by i3bar, which are
+    # elements of an infinite JSON array. Data can be fed in arbitrary chunks,
+    # each complete element is decoded as soon as its closing bracket arrives.
+    def __init__(self):
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        self._buffer = ''
+        self._pos = 0
+        self._start = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._opened = False
+
+    def feed(self, data):
+        # returns a list of decoded events and a list of invalid elements
+        buf = self._buffer + self._text_decoder.decode(data)
+        events = []
+        invalid = []
+        i = self._pos
+        n = len(buf)
+        while i < n:
+            c = buf[i]
+            if self._depth == 0:
+                if c in ' \t\r\n,':
+                    pass
+                elif c == '[' and not self._opened:
+                    self._opened = True
+                elif c in '[{':
+                    self._opened = True
+                    self._start = i
+                    self._depth = 1
+                else:
+                    # garbage outside of an element, skip the line
+                    end = buf.find('\n', i)
+                    if end == -1:
+                        end = n
+                    invalid.append(buf[i:end])
+                    i = end
+                    continue
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c in '[{':
+                self._depth += 1
+            elif c in ']}':
+                self._depth -= 1
+                if self._depth == 0:
+                    element = buf[self._start:i + 1]
+                    try:
+                        events.append(json.loads(element))
+                    except ValueError:
+                        invalid.append(element)
+            i += 1
+        if self._depth:
+            # keep the incomplete element for the next call
+            self._buffer = buf[self._start:]
+            self._pos = i - self._start
+            self._start = 0
+        else:
+            self._buffer = ''
+            self._pos = 0
+        return events, invalid
+
+
+def pop_click_event(queue, coalesce_scroll=False):
+    # Pops the next click event from `queue`. If `coalesce_scroll` is set,
+    # consecutive scroll events on the same block are merged into a single
+    # event with the number of merged events in the "repeat" key.
+    click = queue.popleft()
+    if not (coalesce_scroll and isinstance(click, dict) and
+            click.get('button') in SCROLL_BUTTONS):
+        return click
+    key = (click.get('name'), click.get('instance'), click['button'])
+    repeat = 1
+    while queue:
+        nxt = queue[0]
+        if not (isinstance(nxt, dict) and key == (nxt.get('name'),
+                nxt.get('instance'), nxt.get('button'))):
+            break
+        click = queue.popleft()
+        repeat += 1
+    if repeat > 1:
+        click = dict(click, repeat=repeat)
+    return click
+
+
 class I3Hub(object):
     def __init__(self, loop, conn, i3bar_reader, i3bar_writer,
             extensions, config, runtime_dir=None,
-            status_output_sort_keys=False):
+            status_output_sort_keys=False, spawner=None,
+            discovery_cache=None, connect_cb=None):
         self._loop = loop
         self._conn = conn
         self._i3bar_reader = i3bar_reader
-        self._i3bar_writer = i3bar_writer
+        self._i3bar_writer = None
+        if i3bar_writer is not None:
+            self._i3bar_writer = I3BarWriter(loop, i3bar_writer)
         self._extensions = extensions
         self._registered_extensions = {}
+        self._lazy_extensions = {}
+        self._module_extensions = {}
+        self._handler_owners = {}
+        self._requires = {}
+        self._ready = {}
+        self._init_tasks = []
+        # extensions that were skipped by a frame while initializing
+        self._refresh_when_ready = set()
+        self._discovery_cache = discovery_cache
+        self._connect_cb = connect_cb
+        self._subscribed_i3_events = set()
+        # i3 events each extension is interested in. The hub itself (None)
+        # always needs the shutdown event to detect restarts.
+        self._i3_interest = {None: {'shutdown'}}
+        self._resubscribe_handle = None
         self._config = config
         self._runtime_dir = runtime_dir
         self._status_output_sort_keys = status_output_sort_keys
-        self._first_status_update = True
         self._i3api = None
+        # each extension gets its own API object, bound to its name
+        self._extension_apis = {}
+        self._scheduler = Scheduler(loop, self._refresh_i3bar)
+        if spawner is None:
+            spawner = Spawner()
+        spawner.attach(loop)
+        self._spawner = spawner
+        self._click_queue = collections.deque()
+        self._click_dispatcher = None
+        self._refresh_task = None
         self._event_handlers = {}
+        self._click_handlers = {}
+        self._nop_handlers = {}
+        self._nop_pattern = None
         self._closed = False
 
     @property
     def run_as_status(self):
         return self._i3bar_writer is not None
 
-    def _add_event_handler(self, event, handler):
-        print('subscribing {handler} ({module}) to event "{event}"'.format(
-            handler=handler,
-            module=sys.modules[handler.__module__].__file__,
-            event=event))
+    @property
+    def i3bar_stats(self):
+        return self._i3bar_writer.stats if self._i3bar_writer else None
+
+    def _add_event_handler(self, event, handler, verbose=True):
+        if verbose:
+            logger.debug('subscribing %s (%s) to event "%s"', handler,
+                    sys.modules[handler.__module__].__file__, event)
         if event not in self._event_handlers:
             self._event_handlers[event] = []
         self._event_handlers[event].append(handler)
 
-    async def _setup_events(self):
-        def is_class_extension(obj):
-            return getattr(obj, '_i3hub_class_extension', False)
-
-        def is_event_handler(obj):
-            return callable(obj) and hasattr(obj, '_i3hub_listen_to')
-
-        def discover_event_handlers(name, extension, subscribed_i3_events):
-            is_module = extension.__class__.__name__ == 'module'
-
-            if is_module: 
-                n = None
-                # if this is a module, check for any class extensions inside it
-                for _, cls in inspect.getmembers(extension, is_class_extension):
-                    extension_instance = cls(self._i3api)
-                    n = discover_event_handlers(cls._i3hub_extension_name or
-                            name, extension_instance, subscribed_i3_events)
-                if n == name:
-                    # class extension already used the module name as extension
-                    # name, no need to continue
-                    return
+    def _add_click_handler(self, block, handler, verbose=True):
+        if block in self._click_handlers:
+            logger.warning('clicks on %s are already handled by %s, ignoring %s',
+                    block, self._click_handlers[block], handler)
+            return
+        if verbose:
+            logger.debug('routing clicks on %s to %s', block, handler)
+        self._click_handlers[block] = handler
+
+    def _route_click(self, click):
+        if not isinstance(click, dict):
+            return None
+        name = click.get('name')
+        handler = self._click_handlers.get((name, click.get('instance')))
+        if handler is None:
+            handler = self._click_handlers.get((name, None))
+        return handler
+
+    def _add_nop_handler(self, verb, handler, verbose=True):
+        if verbose:
+            logger.debug('routing "nop %s" bindings to %s', verb, handler)
+        if verb not in self._nop_handlers:
+            self._nop_handlers[verb] = []
+        self._nop_handlers[verb].append(handler)
+
+    def _compile_nop_router(self):
+        if not self._nop_handlers:
+            self._nop_pattern = None
+            return
+        # longest verbs first, so a verb that is a prefix of another verb
+        # can't shadow it
+        verbs = sorted(self._nop_handlers, key=len, reverse=True)
+        self._nop_pattern = re.compile(r'\s*nop\s+({})(?:\s+|$)'.format(
+            '|'.join(re.escape(v) for v in verbs)))
+
+    def _route_nop_binding(self, payload):
+        if self._nop_pattern is None or payload.get('change') != 'run':
+            return
+        command = payload['binding']['command']
+        if not command.lstrip().startswith('nop'):
+            return
+        match = self._nop_pattern.match(command)
+        if not match:
+            return
+        verb = match.group(1)
+        args = shlex.split(command[match.end():])
+        for handler in self._nop_handlers[verb]:
+            self._loop.create_task(self._invoke_when_ready(handler,
+                'nop::' + verb, args))
+
+    def _describe_extension(self, extension):
+        module_path = getattr(extension, '__file__', None)
+        if self._discovery_cache and module_path:
+            description = self._discovery_cache.lookup(module_path)
+            if description is not None and describes(extension, description):
+                return description, True
+        description = describe_extension(extension)
+        if self._discovery_cache and module_path:
+            self._discovery_cache.store(module_path, description)
+        return description, False
+
+    def _discover_event_handlers(self, name, extension, subscribed_i3_events,
+            handlers):
+        description, cached = self._describe_extension(extension)
+        n = None
+        # if this is a module, register any class extensions inside it
+        for attr, extension_name in description['classes']:
+            extension_instance = getattr(extension, attr)(
+                    self._extension_api(extension_name or name))
+            n = self._register_extension(extension_name or name,
+                    extension_instance, description['handlers'][attr],
+                    subscribed_i3_events, handlers, cached)
+        if n == name:
+            # class extension already used the module name as extension
+            # name, no need to continue
+            return n
+        return self._register_extension(name, extension,
+                description['handlers'][''], subscribed_i3_events, handlers,
+                cached)
+
+    def _register_extension(self, name, extension, handler_specs,
+            subscribed_i3_events, handlers, cached):
+        if (getattr(extension, '_I3HUB_STATUS_EXTENSION', False)
+                and not self.run_as_status):
+            # extension should only be used when i3hub is running
+            # as status command
+            return
 
-            if (getattr(extension, '_I3HUB_STATUS_EXTENSION', False)
-                    and not self.run_as_status):
-                # extension should only be used when i3hub is running
-                # as status command
-                return
+        # don't allow more than one extension per name
+        if name in self._registered_extensions:
+            logger.warning('Multiple extension with name "%s". '
+                    'Only the first was registered.', name)
+            return
 
-            # don't allow more than one extension per name
-            if name in self._registered_extensions:
-                print((
-                    'WARNING: Multiple extension with name "{}". '
-                    'Only the first was registered.' 
-                    ).format(name))
-                return
+        # handlers are only logged when they are discovered, not when they are
+        # registered from the cache
+        verbose = not cached
+        i3_events = set()
+        for attr, events, clicks, verbs in handler_specs:
+            handler = getattr(extension, attr)
+            for event in events:
+                ns, ev = event.split('::', maxsplit=1)
+                if ns == 'i3':
+                    i3_events.add(ev)
+                self._add_event_handler(event, handler, verbose)
+            for block in clicks:
+                self._add_click_handler(tuple(block), handler, verbose)
+            for verb in verbs:
+                i3_events.add('binding')
+                self._add_nop_handler(verb, handler, verbose)
+            handlers.append(handler)
+            self._handler_owners[handler] = name
+        subscribed_i3_events.update(i3_events)
+        self._add_interest(name, i3_events)
+        self._requires[name] = tuple(getattr(extension, '_I3HUB_REQUIRES', ()))
+        self._registered_extensions[name] = extension
+        logger.info('registered extension "%s"%s', name,
+                ' (cached)' if cached else '')
+        return name
+
+    def _register_module(self, name, extension, subscribed_i3_events,
+            handlers):
+        # register a loaded extension and remember the names of the extensions
+        # it contains, so they can be unloaded together
+        registered = set(self._registered_extensions)
+        self._discover_event_handlers(name, extension, subscribed_i3_events,
+                handlers)
+        names = [n for n in self._registered_extensions if n not in registered]
+        self._module_extensions[name] = names
+        return names
+
+    def _unregister_extension(self, name):
+        handlers = [h for h, owner in self._handler_owners.items()
+                if owner == name]
+        for handler in handlers:
+            self._remove_handler(handler)
+            del self._handler_owners[handler]
+        for block, handler in list(self._click_handlers.items()):
+            if handler in handlers:
+                del self._click_handlers[block]
+        ready = self._ready.pop(name, None)
+        if ready is not None and not ready.done():
+            ready.cancel()
+        self._requires.pop(name, None)
+        self._remove_interest(name)
+        self._extension_apis.pop(name, None)
+        del self._registered_extensions[name]
+        logger.info('unregistered extension "%s"', name)
+
+    def _add_interest(self, owner, events):
+        self._i3_interest.setdefault(owner, set()).update(events)
+
+    def _remove_interest(self, owner, events=None):
+        # without `events`, all interest of `owner` is removed
+        interest = self._i3_interest.get(owner, set())
+        interest.difference_update(interest if events is None else events)
+        if not interest:
+            self._i3_interest.pop(owner, None)
+        if not self._wanted_i3_events() >= self._subscribed_i3_events:
+            self._schedule_resubscribe()
+
+    def _wanted_i3_events(self):
+        return set().union(*self._i3_interest.values())
+
+    async def _update_subscriptions(self):
+        # subscriptions can be extended on the current connection. Events that
+        # are no longer wanted are removed by _resubscribe.
+        new = self._wanted_i3_events() - self._subscribed_i3_events
+        if new:
+            self._subscribed_i3_events |= new
+            await self._conn.subscribe(sorted(new))
+
+    def _schedule_resubscribe(self):
+        # i3 has no unsubscribe request, the only way to stop receiving an
+        # event is to subscribe on a new connection. Wait a little, interest
+        # is often resumed shortly after being suspended.
+        if self._connect_cb is None or self._resubscribe_handle:
+            return
+        self._resubscribe_handle = self._loop.call_later(
+                self._hub_option('resubscribe_delay', 1),
+                lambda: self._loop.create_task(self._resubscribe()))
+
+    async def _resubscribe(self):
+        self._resubscribe_handle = None
+        wanted = self._wanted_i3_events()
+        if wanted >= self._subscribed_i3_events or self._closed:
+            return
+        try:
+            conn = await self._connect_cb()
+            await conn.subscribe(sorted(wanted))
+        except Exception as e:
+            logger.warning('failed to resubscribe: %s', e)
+            return
+        logger.info('unsubscribed from %s', ', '.join(sorted(
+            self._subscribed_i3_events - wanted)))
+        old = self._switch_connection(conn, wanted)
+        self._loop.create_task(old.close_when_idle())
+
+    def _switch_connection(self, conn, subscribed_i3_events):
+        old = self._conn
+        self._conn = conn
+        for api in self._apis():
+            api._conn = conn
+        self._subscribed_i3_events = set(subscribed_i3_events)
+        return old
+
+    def suspend_event(self, event, owner):
+        self._check_interest_change(event, owner)
+        self._remove_interest(owner, [event])
+
+    async def resume_event(self, event, owner):
+        self._check_interest_change(event, owner)
+        self._add_interest(owner, [event])
+        await self._update_subscriptions()
+
+    def _check_interest_change(self, event, owner):
+        if event not in I3_EVENTS:
+            raise Exception('Invalid i3 event "{}"'.format(event))
+        if owner is None:
+            # the interest of the hub itself can't be changed
+            raise Exception('i3 events can only be suspended or resumed by '
+                    'extensions')
+
+    def _find_extension(self, name):
+        for i, (n, extension) in enumerate(self._extensions):
+            if n == name:
+                return i, extension
+        return None, None
 
-            for _, handler in inspect.getmembers(extension, is_event_handler):
-                for event in handler._i3hub_listen_to:
-                    event.split('::', maxsplit=1)
-                    ns, ev = event.split('::', maxsplit=1)
-                    if ns == 'i3':
-                        subscribed_i3_events.add(ev)
-                    self._add_event_handler(event, handler)
-            self._registered_extensions[name] = extension
-            print('registered extension "{}"'.format(name))
-            return name
+    @property
+    def extension_names(self):
+        return [name for name, _ in self._extensions]
+
+    def extension_paths(self):
+        # maps the files of loaded extensions to their names. Packages are
+        # mapped by directory.
+        paths = {}
+        for name, extension in self._extensions:
+            if isinstance(extension, LazyExtension):
+                path = extension.module_path
+            else:
+                path = getattr(extension, '__file__', None)
+            if not path:
+                continue
+            if os.path.basename(path) == '__init__.py':
+                path = os.path.dirname(path)
+            paths[path] = name
+        return paths
+
+    async def load_extension(self, name, extension):
+        self._extensions.append((name, extension))
+        subscribed_i3_events = set()
+        if isinstance(extension, LazyExtension):
+            self._defer_extension(name, extension, subscribed_i3_events)
+            names = []
+        else:
+            names = self._register_module(name, extension,
+                    subscribed_i3_events, [])
+        self._compile_nop_router()
+        if self._discovery_cache:
+            self._discovery_cache.save()
+        await self._update_subscriptions()
+        self._start_init(names)
+
+    async def _unload_module(self, name):
+        names = self._module_extensions.pop(name, [])
+        for handler in tuple(self._event_handlers.get('i3hub::unload', ())):
+            if self._handler_owners.get(handler) not in names:
+                continue
+            try:
+                await self._invoke_gated(handler, 'i3hub::unload', None)
+            except Exception:
+                logger.exception('failed to unload "%s"',
+                        self._handler_owners[handler])
+        for n in names:
+            self._unregister_extension(n)
+        lazy = self._lazy_extensions.pop(name, None)
+        if lazy and lazy.ready is None:
+            self._remove_handler(lazy.proxy)
+            self._remove_interest(name)
+        self._compile_nop_router()
+        index, extension = self._find_extension(name)
+        spec_name = getattr(extension, 'spec_name', None) or getattr(
+                getattr(extension, '__spec__', None), 'name', None)
+        if spec_name:
+            for module_name in list(sys.modules):
+                if (module_name == spec_name or
+                        module_name.startswith(spec_name + '.')):
+                    del sys.modules[module_name]
+        # remove blocks of the unloaded extensions from the bar
+        self._refresh_i3bar()
+
+    async def unload_extension(self, name):
+        index, extension = self._find_extension(name)
+        if index is None:
+            return
+        await self._unload_module(name)
+        del self._extensions[index]
+        logger.info('unloaded "%s"', name)
 
+    async def reload_extension(self, name):
+        index, extension = self._find_extension(name)
+        if index is None:
+            return
+        if isinstance(extension, LazyExtension):
+            if extension.ready is None:
+                # not loaded yet, the new code will be used when it is
+                return
+            spec_name, module_path = extension.spec_name, extension.module_path
+        elif hasattr(extension, '__spec__') and extension.__file__:
+            spec_name, module_path = extension.__spec__.name, extension.__file__
+        else:
+            logger.warning('"%s" can\'t be reloaded', name)
+            return
+        await self._unload_module(name)
+        logger.info('reloading "%s" from "%s"', spec_name, module_path)
+        try:
+            module = exec_extension_module(spec_name, module_path)
+        except Exception:
+            # keep the old module in the extension list, so the extension is
+            # loaded again when the error is fixed
+            logger.exception('failed to reload "%s"', name)
+            return
+        self._extensions[index] = (name, module)
+        subscribed_i3_events = set()
+        names = self._register_module(name, module, subscribed_i3_events, [])
+        self._compile_nop_router()
+        if self._discovery_cache:
+            self._discovery_cache.save()
+        await self._update_subscriptions()
+        self._start_init(names)
+
+    def reload_config(self, config):
+        # replaces the configuration snapshot and returns the names of the
+        # extensions whose section changed
+        old_config, self._config = self._config, config
+        return [name for name, _ in self._extensions
+                if old_config.get(name) != config.get(name)]
+
+    def _defer_extension(self, name, lazy, subscribed_i3_events):
+        # install proxy handlers for the declared events. The first proxy
+        # that is invoked loads the extension and removes all proxies.
+        async def proxy(i3, event, arg):
+            handlers = await self._load_lazy_extension(name)
+            await self._redispatch(handlers, event, arg)
+
+        logger.info('deferring loading of "%s" until one of %s is dispatched',
+                name, ', '.join(lazy.events))
+        i3_events = set()
+        for event in lazy.events:
+            ns, ev = event.split('::', maxsplit=1)
+            if ns == 'nop':
+                i3_events.add('binding')
+                self._nop_handlers.setdefault(ev, []).append(proxy)
+                continue
+            if ns == 'i3':
+                i3_events.add(ev)
+            self._event_handlers.setdefault(event, []).append(proxy)
+        subscribed_i3_events.update(i3_events)
+        self._add_interest(name, i3_events)
+        lazy.proxy = proxy
+        self._lazy_extensions[name] = lazy
+
+    def _remove_handler(self, handler):
+        for table in (self._event_handlers, self._nop_handlers):
+            for key, handlers in list(table.items()):
+                handlers[:] = [h for h in handlers if h is not handler]
+                if not handlers:
+                    del table[key]
+
+    def _activate_lazy_extension(self, name):
+        lazy = self._lazy_extensions[name]
+        if lazy.ready is not None:
+            return lazy.ready
+        lazy.ready = asyncio.Future(loop=self._loop)
+        # the error is also raised for anyone waiting on the extension, but
+        # there might be no one
+        lazy.ready.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._remove_handler(lazy.proxy)
+        self._remove_interest(name)
+        try:
+            lazy.module = exec_extension_module(lazy.spec_name,
+                    lazy.module_path)
+            subscribed_i3_events = set()
+            names = self._register_module(name, lazy.module,
+                    subscribed_i3_events, lazy.handlers)
+        except Exception as e:
+            logger.exception('failed to load "%s"', name)
+            lazy.ready.set_exception(e)
+            return lazy.ready
+        self._compile_nop_router()
+        if self._discovery_cache:
+            self._discovery_cache.save()
+        undeclared = subscribed_i3_events - self._subscribed_i3_events
+        if undeclared:
+            logger.warning('"%s" listens to undeclared i3 events: %s', name,
+                    ', '.join(sorted(undeclared)))
+            self._loop.create_task(self._update_subscriptions())
+        self._start_init(names)
+        asyncio.gather(*(self._ready[n] for n in names)).add_done_callback(
+                lambda f: lazy.ready.set_result(lazy.handlers))
+        return lazy.ready
+
+    async def _load_lazy_extension(self, name):
+        return await asyncio.shield(self._activate_lazy_extension(name))
+
+    async def _redispatch(self, handlers, event, arg):
+        # dispatch an event that was received by a proxy to the handlers of
+        # the extension that was just loaded
+        ns, ev = event.split('::', maxsplit=1)
+        if ns == 'nop':
+            targets = self._nop_handlers.get(ev, [])
+        elif event == 'i3hub::i3bar_click':
+            routed = self._route_click(arg)
+            targets = [routed] if routed else self._event_handlers.get(event,
+                    [])
+        else:
+            targets = self._event_handlers.get(event, [])
+        for handler in [h for h in targets if h in handlers]:
+            await self._invoke_event_handler(handler, event, arg)
+
+    async def _setup_events(self):
         subscribed_i3_events = set()
         for name, extension in self._extensions:
-            discover_event_handlers(name, extension, subscribed_i3_events)
+            if isinstance(extension, LazyExtension):
+                self._defer_extension(name, extension, subscribed_i3_events)
+            else:
+                self._register_module(name, extension, subscribed_i3_events,
+                        [])
         # subscribe the connection to all i3 events listened by extensions
-        await self._conn.subscribe(list(subscribed_i3_events))
+        self._compile_nop_router()
+        if self._discovery_cache:
+            self._discovery_cache.save()
+        self._subscribed_i3_events = self._wanted_i3_events()
+        await self._conn.subscribe(sorted(self._subscribed_i3_events))
 
     async def _invoke_event_handler(self, handler, event, arg):
-        if inspect.ismethod(handler) and hasattr(handler.__self__,
+        if hasattr(getattr(handler, '__self__', None),
                 '_i3hub_class_extension'):
             await handler(event, arg)
-        else:
+            return
+        owner = self._handler_owners.get(handler)
+        if owner is None:
+            # lazy extension proxies
             await handler(self._i3api, event, arg)
+        else:
+            await handler(self._extension_api(owner), event, arg)
 
     async def _dispatch_event(self, event, arg):
-        for handler in self._event_handlers.get(event, []):
+        # iterate over a copy, lazy extensions may replace handlers while the
+        # event is being dispatched
+        for handler in tuple(self._event_handlers.get(event, ())):
+            await self._invoke_gated(handler, event, arg)
+
+    def _pending_ready(self, handler):
+        ready = self._ready.get(self._handler_owners.get(handler))
+        if ready is not None and not ready.done():
+            return ready
+        return None
+
+    async def _invoke_gated(self, handler, event, arg):
+        # Handlers of extensions that are still initializing are only invoked
+        # after their init handlers finish.
+        ready = self._pending_ready(handler)
+        if ready is None:
             await self._invoke_event_handler(handler, event, arg)
-
-    async def _dispatch_init_event(self):
-        event = 'i3hub::init'
-        for handler in self._event_handlers.get(event, []):
-            module_name = handler.__module__
-            section_name = module_name.split('.')[2]
-            if section_name not in self._config:
-                self._config[section_name] = {}
-            await self._invoke_event_handler(handler, event, {
-                'running_as_status': self.run_as_status,
-                'config': self._config[section_name]
-                })
+        elif event == 'i3hub::i3bar_refresh':
+            # the frame can't wait, skip the extension and render a new frame
+            # once it is initialized
+            self._refresh_when_ready.add(self._handler_owners[handler])
+        elif event in ('i3::shutdown', 'i3hub::unload'):
+            # these must run before the hub or the extension go away
+            timeout = self._hub_option('init_timeout', 5)
+            done, _ = await asyncio.wait([asyncio.shield(ready)],
+                    timeout=timeout)
+            if done:
+                await self._invoke_event_handler(handler, event, arg)
+            else:
+                logger.warning('"%s" is not initialized, not sending %s',
+                        self._handler_owners[handler], event)
+        else:
+            # don't hold back extensions that are already initialized
+            self._loop.create_task(self._invoke_when_ready(handler, event,
+                arg))
+
+    async def _invoke_init_handler(self, handler):
+        module_name = handler.__module__
+        section_name = module_name.split('.')[2]
+        await self._invoke_event_handler(handler, 'i3hub::init', {
+            'running_as_status': self.run_as_status,
+            'config': self._config.get(section_name, EMPTY_SECTION)
+            })
+
+    def _ready_future(self, name):
+        if name in self._lazy_extensions:
+            self._activate_lazy_extension(name)
+        return self._ready.get(name)
+
+    def _depends_on(self, name, dependency, seen=None):
+        if seen is None:
+            seen = set()
+        for dep in self._requires.get(name, ()):
+            if dep == dependency:
+                return True
+            if dep not in seen:
+                seen.add(dep)
+                if self._depends_on(dep, dependency, seen):
+                    return True
+        return False
+
+    async def _init_extension(self, name):
+        try:
+            for dep in self._requires[name]:
+                if self._depends_on(dep, name):
+                    logger.warning('circular dependency between "%s" and "%s"',
+                            name, dep)
+                    continue
+                ready = self._ready_future(dep)
+                if ready is None:
+                    logger.warning('"%s" requires "%s", which is not loaded',
+                            name, dep)
+                    continue
+                await asyncio.shield(ready)
+            timeout = self._hub_option('init_timeout', 5)
+            init = self._loop.create_task(self._run_init_handlers(name))
+            self._init_tasks.append(init)
+            done, _ = await asyncio.wait([init], timeout=timeout)
+            if not done:
+                # give up on it, so dependents and queued events don't wait
+                # forever
+                logger.error('"%s" did not initialize in %s seconds', name,
+                        timeout)
+                init.cancel()
+                return
+            await init
+        except Exception:
+            logger.exception('failed to initialize "%s"', name)
+        finally:
+            self._set_ready(name)
+
+    def _set_ready(self, name):
+        if not self._ready[name].done():
+            self._ready[name].set_result(None)
+        if name in self._refresh_when_ready:
+            self._refresh_when_ready.discard(name)
+            self._refresh_i3bar()
+
+    async def _run_init_handlers(self, name):
+        for handler in tuple(self._event_handlers.get('i3hub::init', ())):
+            if self._handler_owners.get(handler) == name:
+                await self._invoke_init_handler(handler)
+        # set before returning, so a refresh requested by the last init
+        # handler already includes the extension
+        self._set_ready(name)
+
+    def _start_init(self, names):
+        # extensions are initialized concurrently. Each extension waits for
+        # the extensions it requires, and i3 events are only dispatched to an
+        # extension after it is initialized.
+        for name in names:
+            self._ready[name] = asyncio.Future(loop=self._loop)
+        for name in names:
+            self._init_tasks.append(self._loop.create_task(
+                self._init_extension(name)))
+
+    async def _invoke_when_ready(self, handler, event, arg):
+        ready = self._ready.get(self._handler_owners.get(handler))
+        if ready is not None and not ready.done():
+            await asyncio.shield(ready)
+        await self._invoke_event_handler(handler, event, arg)
 
     async def dispatch_stop(self):
         return await self._dispatch_event('i3hub::i3bar_suspend', None) 
@@ -325,92 +1527,175 @@ class I3Hub(object):
     async def dispatch_cont(self):
         return await self._dispatch_event('i3hub::i3bar_resume', None) 
 
+    def _refresh_i3bar(self):
+        # coalesce refresh requests made before the next frame is rendered
+        if not self.run_as_status:
+            return None
+        if self._refresh_task is None:
+            self._refresh_task = self._loop.create_task(
+                    self._output_updated_status())
+        return self._refresh_task
+
     async def _output_updated_status(self):
-        if self._first_status_update:
-            self._first_status_update = False
-        else:
-            self._i3bar_writer.write(','.encode('utf-8'))
-        status_array = []
+        self._refresh_task = None
+        status_array = StatusArray()
         await self._dispatch_event('i3hub::i3bar_refresh', status_array)
-        self._i3bar_writer.write(
-                json.dumps(status_array, separators=JSON_SEPS,
-                    sort_keys=self._status_output_sort_keys).encode('utf-8'))
-        self._i3bar_writer.write('\n'.encode('utf-8'))
+        self._i3bar_writer.write_frame(encode_status_array(status_array,
+            sort_keys=self._status_output_sort_keys) + b'\n')
 
     async def _dispatch_shutdown(self, arg):
         # this should be called either when i3 shuts down or when i3hub is
         # killed (connection closed by close(), which results in "eof event")
         if not self._i3api._shutting_down:
-            self._i3api._shutting_down = True
+            for api in self._apis():
+                api._shutting_down = True
             await self._dispatch_event('i3::shutdown', arg)
 
+    def _hub_option(self, name, default=None):
+        if 'i3hub' not in self._config:
+            return default
+        return self._config['i3hub'].get(name, default)
+
     async def _read_click_events(self):
-        # read opening bracket
-        await self._i3bar_reader.readline()
-        is_first = True
-        while not self._i3bar_reader.at_eof():
-            line = await self._i3bar_reader.readline()
-            if not line:
-                print('reached EOF while reading stdin')
+        decoder = ClickEventDecoder()
+        while True:
+            data = await self._i3bar_reader.read(4096)
+            if not data:
+                logger.info('reached EOF while reading stdin')
                 break
-            if is_first:
-                is_first = False
+            events, invalid = decoder.feed(data)
+            for element in invalid:
+                logger.warning('failed to parse click event: %s', element)
+            if events:
+                self._click_queue.extend(events)
+                if not self._click_dispatcher:
+                    # dispatch in a separate task so the reader never waits
+                    # for click handlers
+                    self._click_dispatcher = self._loop.create_task(
+                            self._dispatch_click_events())
+
+    async def _dispatch_click_events(self):
+        coalesce_scroll = self._hub_option('coalesce_scroll', False)
+        while self._click_queue:
+            click = pop_click_event(self._click_queue, coalesce_scroll)
+            handler = self._route_click(click)
+            if handler:
+                await self._invoke_gated(handler, 'i3hub::i3bar_click', click)
             else:
-                # remove leading comma
-                line = line[1:]
-            try:
-                click_event_payload = json.loads(line.decode('utf-8',
-                    'replace'))
-            except json.JSONDecodeError:
-                print('failed to parse click event: {}'.format(line))
-                continue
-            await self._dispatch_event('i3hub::i3bar_click',
-                    click_event_payload)
+                # nobody owns the block, fallback to the event listeners
+                await self._dispatch_event('i3hub::i3bar_click', click)
+        self._click_dispatcher = None
 
     async def _run_status(self, status_ready):
-        print('started running as status command')
+        logger.info('started running as status command')
         click_events = self._i3bar_reader is not None
         if click_events:
             self._loop.create_task(self._read_click_events())
-        self._i3bar_writer.write(json.dumps({
+        self._i3bar_writer.write_header(json.dumps({
             'version': 1,
             'stop_signal': STOP_SIGNAL,
             'cont_signal': CONT_SIGNAL,
             'click_events': click_events
         }, separators=JSON_SEPS,
-        sort_keys=self._status_output_sort_keys).encode('utf-8'))
-        self._i3bar_writer.write('\n[\n'.encode('utf-8'))
+        sort_keys=self._status_output_sort_keys).encode('utf-8') +
+        b'\n[\n')
         status_ready.set_result(None)
 
     async def _dispatch_i3_events(self):
-        print('started dispatching i3 events')
+        logger.info('started dispatching i3 events')
         while True:
-            event, payload = await self._conn.wait_event()
+            conn = self._conn
+            event, payload = await conn.wait_event()
+            if conn is not self._conn:
+                # the connection was replaced after subscribing on the new
+                # one, which delivers these events
+                continue
+            if (event == 'shutdown' and isinstance(payload, dict) and
+                    payload.get('change') == 'restart' and
+                    await self._reconnect()):
+                continue
             if event in ('shutdown', 'eof',):
                 await self._dispatch_shutdown(payload or 'eof')
                 self.close()
                 break
+            if event == 'binding':
+                self._route_nop_binding(payload)
             if event is not None:
                 self._loop.create_task(
                         self._dispatch_event('i3::' + event, payload))
 
+    async def _reconnect(self):
+        # i3 is restarting in place. Instead of shutting down, connect to the
+        # new i3 process and restore the subscriptions, keeping the
+        # extensions alive.
+        if not self._connect_cb or not self._hub_option('reconnect', True):
+            return False
+        logger.info('i3 is restarting, reconnecting')
+        self._conn.close()
+        timeout = self._hub_option('reconnect_timeout', 10)
+        deadline = self._loop.time() + timeout
+        delay = 0.01
+        while self._loop.time() < deadline:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1)
+            try:
+                conn = await self._connect_cb()
+            except Exception as e:
+                logger.warning('failed to reconnect: %s', e)
+                continue
+            wanted = self._wanted_i3_events()
+            try:
+                await conn.subscribe(sorted(wanted))
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                logger.warning('failed to subscribe: %s', e)
+                conn.close()
+                continue
+            self._switch_connection(conn, wanted)
+            logger.info('reconnected to i3')
+            await self._dispatch_event('i3hub::reconnected', None)
+            return True
+        logger.error('failed to reconnect in %s seconds', timeout)
+        return False
+
     def _require(self, name):
+        lazy = self._lazy_extensions.get(name)
+        if lazy and lazy.ready is None:
+            # load the extension now. Its init handlers run in the
+            # background, like with extensions that were loaded eagerly.
+            self._activate_lazy_extension(name)
         rv = self._registered_extensions.get(name, None)
         if not rv:
-            print('Extension "{}" is not loaded'.format(name))
+            logger.error('Extension "%s" is not loaded', name)
             sys.exit(1)
         return rv
 
-    async def run(self):
-        if self._closed:
-            raise Exception('This I3Hub instance was already closed')
-        print('starting')
-        self._i3api = I3ApiWrapper(self._conn,
-                refresh_i3bar_cb=lambda: self._loop.create_task(
-                    self._output_updated_status()),
+    def _new_api(self, owner):
+        return I3ApiWrapper(self._conn,
+                refresh_i3bar_cb=self._refresh_i3bar,
                 emit_event_cb=self._dispatch_event,
                 require_cb=self._require,
+                every_cb=self._scheduler.every,
+                suspend_event_cb=lambda event: self.suspend_event(event,
+                    owner),
+                resume_event_cb=lambda event: self.resume_event(event, owner),
+                spawner=self._spawner,
                 runtime_dir=self._runtime_dir)
+
+    def _extension_api(self, name):
+        api = self._extension_apis.get(name)
+        if api is None:
+            api = self._extension_apis[name] = self._new_api(name)
+            api._shutting_down = self._i3api._shutting_down
+        return api
+
+    def _apis(self):
+        return [self._i3api] + list(self._extension_apis.values())
+
+    async def run(self):
+        if self._closed:
+            raise Exception('This I3Hub instance was already closed')
+        logger.info('starting')
+        self._i3api = self._new_api(None)
         await self._setup_events()
         futures = []
         if self.run_as_status:
@@ -422,27 +1707,39 @@ class I3Hub(object):
             futures.append(asyncio.ensure_future(self._run_status(
                 status_ready)))
             await status_ready
-        # dispatch the init event before reading events from i3
-        await self._dispatch_init_event()
-        # start reading events from i3
+        # initialize extensions and start reading events from i3 without
+        # waiting, i3 events are queued until the extensions handling them are
+        # ready
+        self._start_init(list(self._registered_extensions))
         futures.append(asyncio.ensure_future(self._dispatch_i3_events()))
         await asyncio.gather(*futures)
         await self._dispatch_shutdown('close')
-        print('stopped')
+        logger.info('stopped')
 
     def close(self):
         if self._closed:
             return
-        print('stopping')
+        logger.info('stopping')
         if self._i3bar_reader:
             self._i3bar_reader.feed_eof()
+        if self._i3bar_writer:
+            self._i3bar_writer.close()
+        for task in self._init_tasks:
+            task.cancel()
+        for ready in self._ready.values():
+            # handlers waiting for extensions to initialize are cancelled
+            ready.cancel()
+        if self._resubscribe_handle:
+            self._resubscribe_handle.cancel()
+        self._scheduler.close()
+        self._spawner.close()
         self._conn.close()
         self._closed = True
 
 
 def extension(name=None):
     def dec(cls):
-        if not (inspect.isclass(cls) and cls.__name__ != 'module'):
+        if not (isinstance(cls, type) and cls.__name__ != 'module'):
             raise Exception('The @extension decorator is for classes only')
         cls._i3hub_extension_name = name
         cls._i3hub_class_extension = True
@@ -471,45 +1768,558 @@ def listen(event):
     return dec
 
 
+def click(name, instance=None):
+    # Route clicks on blocks with the given name (and instance, if not None)
+    # directly to the decorated handler. Clicks on blocks that are not owned
+    # by any handler are dispatched through the "i3hub::i3bar_click" event.
+    def dec(fn):
+        if not inspect.iscoroutinefunction(fn):
+            raise Exception('Only coroutine functions can be click handlers')
+        if not hasattr(fn, '_i3hub_clicks'):
+            fn._i3hub_clicks = []
+        fn._i3hub_clicks.append((name, instance))
+        return fn
+    return dec
+
+
+def nop(verb):
+    # Handle i3 bindings of the form "nop <verb> [args...]". The handler
+    # receives "nop::<verb>" as the event name and the shell-split arguments
+    # that follow the verb.
+    if not verb or verb.split() != [verb]:
+        raise Exception('"{}" is not a valid nop verb'.format(verb))
+    def dec(fn):
+        if not inspect.iscoroutinefunction(fn):
+            raise Exception('Only coroutine functions can be nop handlers')
+        if not hasattr(fn, '_i3hub_nop_verbs'):
+            fn._i3hub_nop_verbs = []
+        fn._i3hub_nop_verbs.append(verb)
+        return fn
+    return dec
+
+
 async def connect(socket_path=None, loop=None):
     if not socket_path:
         socket_path = get_socket_path()
     if not loop:
         loop = asyncio.get_event_loop()
-    reader, writer = await asyncio.open_unix_connection(socket_path, loop=loop)
+    # the streams use the running loop, passing it explicitly is not
+    # supported since python 3.10
+    reader, writer = await asyncio.open_unix_connection(socket_path)
     return I3Connection(loop, reader, writer)
 
 
+class RawBlocks(object):
+    # An already encoded JSON array of i3bar blocks, usually produced by
+    # another status program. When added to the status array with
+    # StatusArray.append_raw, it is spliced into the frame as is instead of
+    # being decoded and encoded again. The blocks are only decoded when
+    # needed, eg: when another extension merges a block into them.
+    __slots__ = ('data', '_blocks')
+
+    def __init__(self, data):
+        self.data = data.strip()
+        self._blocks = None
+
+    @property
+    def blocks(self):
+        if self._blocks is None:
+            self._blocks = json.loads(self.data.decode('utf-8', 'replace'))
+        return self._blocks
+
+
+class StatusArrayMeta(type):
+    # list methods that expose items or positions decode raw blocks first
+    DECODING_METHODS = ('__iter__', '__reversed__', '__len__', '__getitem__',
+            '__setitem__', '__delitem__', '__contains__', '__eq__', '__ne__',
+            '__repr__', '__add__', '__mul__', 'copy', 'count', 'index',
+            'insert', 'pop', 'remove', 'reverse', 'sort')
+
+    def __new__(cls, clsname, superclasses, attrs):
+        def gen_method(name):
+            method = getattr(list, name)
+            def decoding_method(self, *args, **kwargs):
+                self.decode()
+                return method(self, *args, **kwargs)
+            decoding_method.__name__ = name
+            return decoding_method
+
+        for name in cls.DECODING_METHODS:
+            attrs[name] = gen_method(name)
+        attrs['__hash__'] = None
+        return type.__new__(cls, clsname, superclasses, attrs)
+
+
+class StatusArray(list, metaclass=StatusArrayMeta):
+    # The status array passed to "i3hub::i3bar_refresh" handlers. RawBlocks
+    # added with append_raw stay encoded, unless a handler reads the array or
+    # modifies it by position, in which case they are replaced by decoded
+    # copies of their blocks. Handlers always see plain blocks.
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._raw = False
+
+    def append_raw(self, raw):
+        self._raw = True
+        list.append(self, raw)
+
+    def decode(self):
+        if not self._raw:
+            return
+        self._raw = False
+        items = []
+        for item in list.__iter__(self):
+            if isinstance(item, RawBlocks):
+                items.extend(dict(b) for b in item.blocks)
+            else:
+                items.append(item)
+        list.__setitem__(self, slice(None), items)
+
+
+def encode_status_array(status_array, sort_keys=False):
+    # list methods are used to read the items without decoding raw blocks
+    items = list(list.__iter__(status_array))
+    if not any(isinstance(item, RawBlocks) for item in items):
+        return json.dumps(items, separators=JSON_SEPS,
+                sort_keys=sort_keys).encode('utf-8')
+    parts = []
+    for item in items:
+        if isinstance(item, RawBlocks) and sort_keys:
+            data = json.dumps(item.blocks, separators=JSON_SEPS,
+                    sort_keys=True).encode('utf-8')[1:-1]
+            if data:
+                parts.append(data)
+        elif isinstance(item, RawBlocks):
+            # strip the enclosing brackets
+            data = item.data[1:-1].strip()
+            if data:
+                parts.append(data)
+        else:
+            parts.append(json.dumps(item, separators=JSON_SEPS,
+                sort_keys=sort_keys).encode('utf-8'))
+    return b'[' + b','.join(parts) + b']'
+
+
 def status_array_merge(status_array, item):
+    # list methods are used so raw blocks of a StatusArray are only decoded
+    # if one of them is modified
     updated = False
-    for obj in status_array:
+    for i, obj in enumerate(list.__iter__(status_array)):
+        if isinstance(obj, RawBlocks):
+            if any(block.get('name') == item['name'] for block in obj.blocks):
+                # a raw block has to be modified, so splice decoded copies
+                # of the blocks in place of the raw data
+                list.__setitem__(status_array, slice(i, i + 1),
+                        [dict(b) for b in obj.blocks])
+                return status_array_merge(status_array, item)
+            continue
         if obj['name'] == item['name']:
             obj.update(item)
             updated = True
             break
     if not updated:
-        status_array.insert(0, item)
+        list.insert(status_array, 0, item)
 
 
 def get_socket_path():
+    # i3 exports I3SOCK to the processes it starts
+    socket_path = os.environ.get('I3SOCK')
+    if socket_path:
+        return socket_path
+    # otherwise look for the socket of a running i3 in the runtime dir, which
+    # is where i3 creates it by default
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        socket_path = find_ipc_socket(os.path.join(runtime_dir, 'i3'))
+        if socket_path:
+            return socket_path
+    import subprocess
     return subprocess.check_output(['i3', '--get-socketpath']).decode().strip()
 
 
-def load_extensions(paths, extensions):
+def find_ipc_socket(directory):
+    # sockets are named "ipc-socket.<pid>". Sockets left behind by i3
+    # processes that no longer exist are skipped, and the newest socket wins
+    # if more than one i3 is running.
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return None
+    candidates = []
+    for name in names:
+        if not name.startswith('ipc-socket.'):
+            continue
+        try:
+            os.kill(int(name[len('ipc-socket.'):]), 0)
+        except ValueError:
+            continue
+        except ProcessLookupError:
+            continue
+        except PermissionError:
+            pass
+        path = os.path.join(directory, name)
+        try:
+            candidates.append((os.stat(path).st_mtime, path))
+        except OSError:
+            continue
+    if not candidates:
+        return None
+    return max(candidates)[1]
+
+
+class Inotify(object):
+    # Minimal inotify binding. Directories are watched instead of files, since
+    # editors usually replace files instead of writing to them.
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_TO = 0x80
+    IN_DELETE = 0x200
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self):
+        import ctypes
+        self._ctypes = ctypes
+        # the symbols of the C library are already loaded in the process
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            self._raise()
+        self._watches = {}
+
+    def _raise(self):
+        errno = self._ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+    def watch(self, directory):
+        if directory in self._watches.values():
+            return
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory),
+                self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_DELETE)
+        if wd < 0:
+            self._raise()
+        self._watches[wd] = directory
+
+    def read(self):
+        # returns the paths of files changed since the last call
+        paths = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * KB)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, _, _, length = self.EVENT.unpack_from(data, offset)
+                offset += self.EVENT.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                directory = self._watches.get(wd)
+                if directory is not None and name:
+                    paths.append(os.path.join(directory, os.fsdecode(name)))
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+class HotReloader(object):
+    # Reloads extensions when their files or their configuration sections
+    # change. `load_config_cb` returns the new configuration snapshot and the
+    # list of extensions to load, and `load_extensions_cb` is called with
+    # extensions that were added to the configuration.
+    DELAY = 0.2
+
+    def __init__(self, loop, hub, config_files, config_dirs,
+            load_config_cb, load_extensions_cb):
+        self._loop = loop
+        self._hub = hub
+        self._config_files = set(config_files)
+        self._config_dirs = set(config_dirs)
+        self._load_config_cb = load_config_cb
+        self._load_extensions_cb = load_extensions_cb
+        self._inotify = None
+        self._changed = set()
+        self._handle = None
+        self._task = None
+
+    def start(self):
+        try:
+            self._inotify = Inotify()
+        except (OSError, AttributeError) as e:
+            logger.warning('inotify is not available, hot reload is disabled '
+                    '(%s)', e)
+            return
+        directories = set(self._config_dirs)
+        directories.update(os.path.dirname(f) for f in self._config_files)
+        for directory in directories:
+            self._watch(directory)
+        self._watch_extensions()
+        self._loop.add_reader(self._inotify.fd, self._on_inotify)
+
+    def _watch(self, directory):
+        if os.path.isdir(directory):
+            try:
+                self._inotify.watch(directory)
+            except OSError as e:
+                logger.warning('failed to watch "%s": %s', directory, e)
+
+    def _watch_extensions(self):
+        for path in self._hub.extension_paths():
+            self._watch(path if os.path.isdir(path) else
+                    os.path.dirname(path))
+
+    def _on_inotify(self):
+        self._changed.update(self._inotify.read())
+        # wait for changes to settle, editors may write multiple files
+        if self._handle:
+            self._handle.cancel()
+        self._handle = self._loop.call_later(self.DELAY, self._process)
+
+    def _process(self):
+        self._handle = None
+        if self._task is None or self._task.done():
+            self._task = self._loop.create_task(self._reload())
+
+    def _is_config(self, path):
+        return path in self._config_files or (path.endswith('.cfg') and
+                os.path.dirname(path) in self._config_dirs)
+
+    def _changed_extensions(self, changed):
+        names = set()
+        for extension_path, name in self._hub.extension_paths().items():
+            for path in changed:
+                if path == extension_path or (path.endswith('.py') and
+                        path.startswith(extension_path + os.sep)):
+                    names.add(name)
+        return names
+
+    async def _reload_config(self):
+        try:
+            config, extensions = self._load_config_cb()
+        except Exception:
+            logger.exception('failed to reload the configuration')
+            return set(), set()
+        wanted = [os.path.basename(e.rstrip('/')) for e in extensions]
+        wanted = [w[:-3] if w.endswith('.py') else w for w in wanted]
+        loaded = self._hub.extension_names
+        changed = set(self._hub.reload_config(config))
+        for name in loaded:
+            if name not in wanted:
+                await self._hub.unload_extension(name)
+        added = [e for e, w in zip(extensions, wanted) if w not in loaded]
+        for name, extension in self._load_extensions_cb(added):
+            await self._hub.load_extension(name, extension)
+        return changed, set(loaded) - set(wanted)
+
+    async def _reload(self):
+        while self._changed:
+            changed, self._changed = self._changed, set()
+            names = self._changed_extensions(changed)
+            if any(self._is_config(p) for p in changed):
+                logger.info('configuration changed')
+                config_changed, removed = await self._reload_config()
+                names = (names | config_changed) - removed
+            for name in sorted(names):
+                await self._hub.reload_extension(name)
+            self._watch_extensions()
+
+    def close(self):
+        if self._handle:
+            self._handle.cancel()
+        if self._inotify:
+            self._loop.remove_reader(self._inotify.fd)
+            self._inotify.close()
+            self._inotify = None
+
+
+def describe_extension(extension):
+    # Lists the class extensions and event handlers declared by an extension,
+    # by attribute name. Handlers of the extension object itself are stored
+    # with the "" key.
+    def is_class_extension(obj):
+        return getattr(obj, '_i3hub_class_extension', False)
+
+    def is_event_handler(obj):
+        return callable(obj) and (hasattr(obj, '_i3hub_listen_to') or
+                hasattr(obj, '_i3hub_clicks') or
+                hasattr(obj, '_i3hub_nop_verbs'))
+
+    def handler_specs(obj):
+        return [[attr, list(getattr(handler, '_i3hub_listen_to', [])),
+            [list(b) for b in getattr(handler, '_i3hub_clicks', [])],
+            list(getattr(handler, '_i3hub_nop_verbs', []))]
+            for attr, handler in inspect.getmembers(obj, is_event_handler)]
+
+    classes = []
+    handlers = {}
+    if extension.__class__.__name__ == 'module':
+        for attr, cls in inspect.getmembers(extension, is_class_extension):
+            classes.append([attr, cls._i3hub_extension_name])
+            handlers[attr] = handler_specs(cls)
+    handlers[''] = handler_specs(extension)
+    return {'classes': classes, 'handlers': handlers}
+
+
+def find_extension(paths, extension):
+    candidates = []
+    for path in paths:
+        for ext in ['.py', '']:
+            p = os.path.join(path, extension) + ext
+            if os.path.exists(p):
+                candidates.append(p)
+    return candidates
+
+
+class DiscoveryCache(object):
+    # Remembers where extensions were found and which handlers they declare,
+    # so unchanged extensions can be registered without searching the
+    # extension path or introspecting modules. Modules are keyed by path,
+    # mtime and size (of every python file for packages), and search results
+    # by the mtimes of the searched directories.
+    VERSION = 2
+
+    def __init__(self, path):
+        self._path = path
+        self._dirty = False
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = None
+        if not isinstance(data, dict) or data.get('version') != self.VERSION:
+            data = {'version': self.VERSION, 'paths': {}, 'modules': {}}
+        self._data = data
+
+    def _stat(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return [st.st_mtime_ns, st.st_size]
+
+    def resolve(self, extension, paths, find):
+        key = '{}:{}'.format(extension, ':'.join(paths))
+        stats = [self._stat(p) for p in paths]
+        entry = self._data['paths'].get(key)
+        if entry and entry['stats'] == stats:
+            return entry['candidates']
+        candidates = find(paths, extension)
+        self._data['paths'][key] = {'stats': stats, 'candidates': candidates}
+        self._dirty = True
+        return candidates
+
+    def _module_stat(self, module_path):
+        if os.path.basename(module_path) != '__init__.py':
+            return self._stat(module_path)
+        # editing any submodule can change the handlers of a package
+        package_dir = os.path.dirname(module_path)
+        stats = []
+        for root, dirs, files in os.walk(package_dir):
+            dirs[:] = sorted(d for d in dirs if d != '__pycache__')
+            for name in sorted(files):
+                if name.endswith('.py'):
+                    path = os.path.join(root, name)
+                    stats.append([os.path.relpath(path, package_dir)] +
+                            (self._stat(path) or []))
+        return stats
+
+    def lookup(self, module_path):
+        entry = self._data['modules'].get(module_path)
+        if entry is None or entry['stat'] != self._module_stat(module_path):
+            return None
+        return entry['description']
+
+    def store(self, module_path, description):
+        self._data['modules'][module_path] = {
+            'stat': self._module_stat(module_path),
+            'description': description
+        }
+        self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        tmp = '{}.tmp'.format(self._path)
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(self._data, f)
+            os.replace(tmp, self._path)
+        except OSError as e:
+            logger.warning('failed to save discovery cache: %s', e)
+            return
+        self._dirty = False
+
+
+class LazyExtension(object):
+    # Extension that is only executed when one of its declared events is first
+    # dispatched. Events are declared with the same names used by @listen, plus
+    # "nop::<verb>" for @nop handlers.
+    def __init__(self, spec_name, module_path, events):
+        for event in events:
+            split = event.split('::', maxsplit=1)
+            if len(split) != 2 or split[0] not in ['i3', 'i3hub', 'extension',
+                    'nop']:
+                raise Exception('"{}" is not a valid event name'.format(event))
+        self.spec_name = spec_name
+        self.module_path = module_path
+        self.events = list(events)
+        self.module = None
+        self.proxy = None
+        self.ready = None
+        self.handlers = []
+
+
+def describes(extension, description):
+    # check that a cached description still matches the extension, in case it
+    # changed without changing the files the cache looked at
+    for attr, _ in description['classes']:
+        if not hasattr(extension, attr):
+            return False
+    for attr, handler_specs in description['handlers'].items():
+        obj = getattr(extension, attr) if attr else extension
+        for spec in handler_specs:
+            if not hasattr(obj, spec[0]):
+                return False
+    return True
+
+
+def exec_extension_module(spec_name, module_path):
+    spec = importlib.util.spec_from_file_location(spec_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    sys.modules[spec_name] = module
+    return module
+
+
+def declared_events(extension_name, candidate, lazy_extensions):
+    # events can be declared in the `lazy_extensions` option or in a
+    # "<extension>.events.json" file installed next to the extension
+    if extension_name in lazy_extensions:
+        return lazy_extensions[extension_name]
+    sidecar = '{}.events.json'.format(candidate[:-3] if
+            candidate.endswith('.py') else candidate.rstrip('/'))
+    if not os.path.exists(sidecar):
+        return None
+    with open(sidecar) as f:
+        return json.load(f)
+
+
+def load_extensions(paths, extensions, lazy_extensions=None, cache=None):
+    if lazy_extensions is None:
+        lazy_extensions = {}
     candidates = []
     for extension in extensions:
         l = len(candidates)
         if '/' in extension:
             if os.path.exists(extension):
                 candidates.append(extension)
+        elif cache:
+            candidates.extend(cache.resolve(extension, paths, find_extension))
         else:
-            for path in paths:
-                for ext in ['.py', '']:
-                    p = os.path.join(path, extension) + ext
-                    if os.path.exists(p):
-                        candidates.append(p)
+            candidates.extend(find_extension(paths, extension))
         if len(candidates) == l:
-            print('warning: extension "{}" was not found'.format(extension))
+            logger.warning('extension "%s" was not found', extension)
     for candidate in candidates:
         is_module = candidate.endswith('.py')
         spec_name = 'i3hub.extensions.{}'.format(os.path.basename(candidate))
@@ -519,26 +2329,49 @@ def load_extensions(paths, extensions):
         else:
             module_path = os.path.join(candidate, '__init__.py')
         if spec_name in sys.modules:
-            print('"{}" already loaded, skipping "{}"'.format(spec_name,
-                candidate))
+            logger.info('"%s" already loaded, skipping "%s"', spec_name,
+                    candidate)
             continue
-        print('loading "{}" from "{}"'.format(spec_name, candidate))
-        spec = importlib.util.spec_from_file_location(spec_name, module_path)
-        module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(module)
-        sys.modules[spec_name] = module
         extension_name = spec_name.replace('i3hub.extensions.', '')
-        yield extension_name, module
+        events = declared_events(extension_name, candidate, lazy_extensions)
+        if events is not None:
+            yield extension_name, LazyExtension(spec_name, module_path, events)
+            continue
+        logger.info('loading "%s" from "%s"', spec_name, candidate)
+        yield extension_name, exec_extension_module(spec_name, module_path)
+
+
+def decode_option(section, option, value, report=True):
+    # options are JSON values, but plain strings don't need to be quoted
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError as e:
+        if report and value.lstrip()[:1] in ('[', '{', '"'):
+            logger.warning('invalid JSON in option "%s" of section [%s]: %s',
+                    option, section, e)
+        return value
+
+
+def freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType(dict((k, freeze(v)) for k, v in
+            value.items()))
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
 
 
 def append_remove_extensions(extensions, config):
     # this function allows to split extensions array definition across various
     # files, which can be useful when creating distro packages that both
     # install and load a certain extension automatically.
-    for ext in config['i3hub'].get('extensions_append', []):
+    section = config['i3hub']
+    for ext in decode_option('i3hub', 'extensions_append',
+            section.get('extensions_append', '[]')):
         if ext not in extensions:
             extensions.append(ext)
-    for ext in config['i3hub'].get('extensions_remove', []):
+    for ext in decode_option('i3hub', 'extensions_remove',
+            section.get('extensions_remove', '[]')):
         if ext in extensions:
             extensions.remove(ext)
     config.remove_option('i3hub', 'extensions_append')
@@ -546,17 +2379,33 @@ def append_remove_extensions(extensions, config):
 
 
 def load_config(config_path, extra_config_dirs):
-    config = configparser.ConfigParser(interpolation=JSONInterpolation())
+    # Returns a read-only snapshot of the configuration: a mapping of section
+    # names to mappings of options. Options are interpolated and decoded once
+    # here, with JSON objects and arrays frozen into mappings and tuples.
+    import configparser
+    config = configparser.ConfigParser(
+            interpolation=configparser.ExtendedInterpolation())
     config['i3hub'] = {}
+    extensions = []
     if os.path.exists(config_path):
         config.read(config_path)
-        extensions = config['i3hub'].get('extensions', [])
+        extensions = list(decode_option('i3hub', 'extensions',
+            config['i3hub'].get('extensions', '[]'), report=False))
         append_remove_extensions(extensions, config)
     for d in extra_config_dirs:
-        for f in glob.iglob('{}/*.cfg'.format(d)):
-            config.read(f)
-            append_remove_extensions(extensions, config)
-    return config, extensions
+        if not os.path.isdir(d):
+            continue
+        for f in sorted(os.listdir(d)):
+            if f.endswith('.cfg'):
+                config.read(os.path.join(d, f))
+                append_remove_extensions(extensions, config)
+    snapshot = {}
+    for section in config.sections():
+        options = {}
+        for option, value in config.items(section):
+            options[option] = freeze(decode_option(section, option, value))
+        snapshot[section] = MappingProxyType(options)
+    return MappingProxyType(snapshot), extensions
 
 
 async def setup_i3bar_streams(loop):
@@ -575,15 +2424,245 @@ async def setup_i3bar_streams(loop):
     return stdin, stdout
 
 
-def setup_logging(loop, log_file):
-    log = open(log_file, 'w', 1)
-    # We dup the log file fd to fds 1 and 2. This will redirect
-    # stdout/stderr output from both i3hub extensions and child processes
-    # to the log file
-    os.dup2(log.fileno(), sys.stdout.fileno())
-    os.dup2(log.fileno(), sys.stderr.fileno())
-    sys.stdout = log
-    sys.stderr = log
+class RateLimitFilter(logging.Filter):
+    # Drops repeated messages. Records are grouped by logger and format
+    # string, so "failed to parse click event: %s" is limited no matter which
+    # element failed. Up to `burst` records of a group are let through every
+    # `interval` seconds. The number of dropped records is reported with the
+    # first record of the next interval, or passed to `report` as a separate
+    # record when the group expires without one. The filter runs in every
+    # thread that logs, so the groups are guarded by a lock.
+    MAX_GROUPS = 1000
+
+    def __init__(self, burst=10, interval=60, report=None):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.report = report
+        self._groups = {}
+        self._next_expire = float('inf')
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, str(record.msg))
+        with self._lock:
+            group = self._groups.get(key)
+            if group is not None and record.created - group[0] < self.interval:
+                group[1] += 1
+                if group[1] > self.burst:
+                    group[2] += 1
+                    group[3] = record
+                    return False
+                return True
+            self._groups.pop(key, None)
+            summaries = self._expire(record.created)
+            self._groups[key] = [record.created, 1, 0, None]
+            self._next_expire = min(self._next_expire,
+                    record.created + self.interval)
+        if group and group[2]:
+            record.msg = '{} ({} similar messages suppressed)'.format(
+                    record.msg, group[2])
+        self._report(summaries)
+        return True
+
+    def flush(self):
+        # report the records suppressed by groups that are still active
+        with self._lock:
+            summaries = [self._summary(group)
+                    for group in self._groups.values() if group[2]]
+            self._groups.clear()
+            self._next_expire = float('inf')
+        self._report(summaries)
+
+    def _expire(self, now):
+        summaries = []
+        if now < self._next_expire and len(self._groups) < self.MAX_GROUPS:
+            return summaries
+        for key, group in list(self._groups.items()):
+            if now - group[0] >= self.interval:
+                del self._groups[key]
+                if group[2]:
+                    summaries.append(self._summary(group))
+        if len(self._groups) >= self.MAX_GROUPS:
+            # still full, evict the oldest group
+            key = min(self._groups, key=lambda k: self._groups[k][0])
+            group = self._groups.pop(key)
+            if group[2]:
+                summaries.append(self._summary(group))
+        self._next_expire = min((group[0] for group in self._groups.values()),
+                default=float('inf')) + self.interval
+        return summaries
+
+    def _summary(self, group):
+        # the last suppressed record stands for the whole group
+        summary = logging.makeLogRecord(group[3].__dict__)
+        summary.msg = '{} ({} similar messages suppressed)'.format(
+                summary.msg, group[2])
+        return summary
+
+    def _report(self, summaries):
+        if self.report is not None:
+            for summary in summaries:
+                self.report(summary)
+
+
+class LogStream(object):
+    # Replaces sys.stdout/sys.stderr, turning each line printed by extensions
+    # into a log record instead of a write to the log file.
+    def __init__(self, logger, level, fd):
+        self._logger = logger
+        self._level = level
+        self._fd = fd
+        self._buffer = ''
+
+    def write(self, data):
+        lines = (self._buffer + data).split('\n')
+        self._buffer = lines.pop()
+        for line in lines:
+            if line:
+                self._logger.log(self._level, line)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+    def fileno(self):
+        return self._fd
+
+
+def forward_output(fd, logger):
+    # log lines written by child processes to the stdout/stderr pipe
+    with open(fd, 'r', errors='replace') as pipe:
+        for line in pipe:
+            line = line.rstrip('\n')
+            if line:
+                logger.info(line)
+
+
+class LogManager(object):
+    # Records are formatted in the thread that logs them, then queued and
+    # written to the log file by a background thread, so logging never
+    # blocks the event loop.
+    FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+    def __init__(self, log_file=None):
+        import logging.handlers
+        import queue
+        if log_file:
+            self._handler = logging.handlers.RotatingFileHandler(log_file,
+                    maxBytes=MB, backupCount=3, encoding='utf-8', delay=True)
+            if os.path.exists(log_file) and os.path.getsize(log_file):
+                # keep the log of the previous run as a backup
+                self._handler.doRollover()
+        else:
+            self._handler = logging.StreamHandler(sys.stderr)
+        self._handler.setFormatter(logging.Formatter(self.FORMAT))
+        self._queue_handler = logging.handlers.QueueHandler(queue.Queue())
+        # summaries of suppressed records skip the filter
+        self.rate_limit = RateLimitFilter(report=self._queue_handler.emit)
+        self._queue_handler.addFilter(self.rate_limit)
+        self._listener = logging.handlers.QueueListener(
+                self._queue_handler.queue, self._handler)
+        self._configured_loggers = set()
+        root = logging.getLogger()
+        root.addHandler(self._queue_handler)
+        root.setLevel(logging.INFO)
+        self._listener.start()
+
+    def replay(self, buffer):
+        # log the records kept by `buffer_logging`
+        logging.getLogger().removeHandler(buffer)
+        buffer.setTarget(self._queue_handler)
+        buffer.close()
+
+    def redirect_output(self):
+        # Redirect fds 1 and 2 to a pipe read by a background thread, which
+        # logs output from child processes. Output from i3hub extensions is
+        # logged directly.
+        rfd, wfd = os.pipe()
+        os.set_inheritable(wfd, True)
+        os.dup2(wfd, sys.stdout.fileno())
+        os.dup2(wfd, sys.stderr.fileno())
+        os.close(wfd)
+        threading.Thread(target=forward_output, daemon=True,
+                args=(rfd, logging.getLogger('i3hub.output'))).start()
+        sys.stdout = LogStream(logging.getLogger('i3hub.stdout'),
+                logging.INFO, 1)
+        sys.stderr = LogStream(logging.getLogger('i3hub.stderr'),
+                logging.WARNING, 2)
+
+    def configure(self, options):
+        # apply the logging options of the [i3hub] section
+        root = logging.getLogger()
+        root.setLevel(self._level(options.get('log_level', 'info'),
+            logging.INFO))
+        levels = options.get('log_levels', {})
+        for name in self._configured_loggers - set(levels):
+            logging.getLogger(name).setLevel(logging.NOTSET)
+        for name, level in levels.items():
+            logging.getLogger(name).setLevel(self._level(level,
+                logging.NOTSET))
+        self._configured_loggers = set(levels)
+        if hasattr(self._handler, 'maxBytes'):
+            self._handler.maxBytes = options.get('log_max_bytes', MB)
+            self._handler.backupCount = options.get('log_backups', 3)
+        self.rate_limit.burst = options.get('log_rate_limit', 10)
+        self.rate_limit.interval = options.get('log_rate_interval', 60)
+
+    def _level(self, name, default):
+        level = logging.getLevelName(str(name).upper())
+        if not isinstance(level, int):
+            logger.warning('invalid log level "%s"', name)
+            return default
+        return level
+
+    def close(self):
+        if isinstance(sys.stdout, LogStream):
+            sys.stdout = sys.__stdout__
+            sys.stderr = sys.__stderr__
+        logging.getLogger().removeHandler(self._queue_handler)
+        self.rate_limit.flush()
+        self._listener.stop()
+        self._handler.close()
+
+
+def buffer_logging():
+    # Keep records logged before setup_logging (eg: configuration warnings)
+    # in memory, so they end up in the log file instead of stderr, which is
+    # the i3bar pipe when running as status.
+    import logging.handlers
+    buffer = logging.handlers.MemoryHandler(1000,
+            flushLevel=logging.CRITICAL + 1)
+    root = logging.getLogger()
+    root.addHandler(buffer)
+    root.setLevel(logging.INFO)
+    return buffer
+
+
+def setup_logging(log_file=None, buffer=None):
+    log = LogManager(log_file)
+    if buffer is not None:
+        log.replay(buffer)
+    if log_file:
+        log.redirect_output()
+    return log
+
+
+def new_event_loop(name='asyncio'):
+    # "uvloop" is used when installed, otherwise the default asyncio loop
+    if name == 'uvloop':
+        try:
+            import uvloop
+        except ImportError:
+            logger.warning('uvloop is not installed, using the asyncio loop')
+        else:
+            return uvloop.new_event_loop()
+    elif name != 'asyncio':
+        logger.warning('unknown event loop "%s", using the asyncio loop', name)
+    return asyncio.new_event_loop()
 
 
 def setup_signals(loop, hub):
@@ -597,35 +2676,78 @@ def setup_signals(loop, hub):
                 lambda: loop.create_task(hub.dispatch_cont()))
 
 
-async def i3hub_main(loop, args):
+async def i3hub_main(loop, args, spawner=None, config=None,
+        log_buffer=None):
     if args.run_as_status:
         # this must be done before redirecting stdout for logging
         i3bar_reader, i3bar_writer = await setup_i3bar_streams(loop)
     else:
         i3bar_reader, i3bar_writer = None, None
-    runtime_dir = '{}/i3hub'.format(get_runtime_dir())
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if not runtime_dir:
+        from xdg.BaseDirectory import get_runtime_dir
+        runtime_dir = get_runtime_dir()
+    runtime_dir = '{}/i3hub'.format(runtime_dir)
     os.makedirs(runtime_dir, exist_ok=True)
-    if args.log_file or args.run_as_status:
-        if not args.log_file:
-            # even if a log file is not specified, always use one when running
-            # as i3bar status since stdout is already used for writing status
-            # updates.
-            args.log_file = '{}/i3hub.log'.format(runtime_dir)
-        setup_logging(loop, args.log_file)
+    if args.run_as_status and not args.log_file:
+        # even if a log file is not specified, always use one when running
+        # as i3bar status since stdout is already used for writing status
+        # updates.
+        args.log_file = '{}/i3hub.log'.format(runtime_dir)
+    log = setup_logging(args.log_file, log_buffer)
+    try:
+        await run_i3hub(loop, args, spawner, runtime_dir, i3bar_reader,
+                i3bar_writer, log, config)
+    finally:
+        log.close()
+
+
+async def run_i3hub(loop, args, spawner, runtime_dir, i3bar_reader,
+        i3bar_writer, log, config):
     # load config
-    config, load = load_config(args.config, args.extra_config_dirs.split(':'))
+    extra_config_dirs = [d for d in args.extra_config_dirs.split(':') if d]
+    if config is None:
+        config = load_config(args.config, extra_config_dirs)
+    config, load = config
+    log.configure(config['i3hub'])
     # load extensions
-    extensions = list(load_extensions(args.extension_path.split(':'),
-        args.load + load))
+    if config['i3hub'].get('discovery_cache', True):
+        cache = DiscoveryCache('{}/discovery.json'.format(runtime_dir))
+    else:
+        cache = None
+    extension_paths = args.extension_path.split(':')
+    lazy_extensions = config['i3hub'].get('lazy_extensions', {})
+    extensions = list(load_extensions(extension_paths, args.load + load,
+        lazy_extensions, cache))
     # connect to i3
     conn = await connect(loop=loop)
     hub = I3Hub(loop, conn, i3bar_reader, i3bar_writer, extensions, config,
-            runtime_dir=runtime_dir)
+            runtime_dir=runtime_dir, spawner=spawner, discovery_cache=cache,
+            connect_cb=lambda: connect(loop=loop))
     setup_signals(loop, hub)
+    reloader = None
+    if config['i3hub'].get('hot_reload', True):
+        def reload_config():
+            config, load = load_config(args.config, extra_config_dirs)
+            log.configure(config['i3hub'])
+            return config, args.load + load
+        def reload_extensions(names):
+            return load_extensions(extension_paths, names, lazy_extensions,
+                    cache)
+        reloader = HotReloader(loop, hub, [args.config], extra_config_dirs,
+                reload_config, reload_extensions)
+        reloader.start()
     await hub.run()
+    if reloader:
+        reloader.close()
 
 
 def parse_args():
+    import argparse
+    from xdg.BaseDirectory import (
+            xdg_config_home,
+            load_data_paths,
+            load_config_paths)
     parser = argparse.ArgumentParser('i3hub')
     parser.add_argument('--load', action='append', default=[])
     data_dirs = list(
@@ -645,13 +2767,26 @@ def parse_args():
             default=':'.join(extra_config_dirs))
     parser.add_argument('--run-as-status', default=False, action='store_true')
     parser.add_argument('--log-file', default=None)
+    parser.add_argument('--loop', default=None, choices=('asyncio', 'uvloop'))
     return parser.parse_args()
 
 
 def main():
     args = parse_args()
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(i3hub_main(loop, args))
+    # fork the spawn server while the process is still small, before the event
+    # loop is created and before extensions are loaded
+    spawner = Spawner()
+    spawner.start_server()
+    log_buffer = buffer_logging()
+    # the configuration is loaded before creating the loop, since it can
+    # choose the loop implementation
+    config = load_config(args.config,
+            [d for d in args.extra_config_dirs.split(':') if d])
+    loop = new_event_loop(args.loop or config[0]['i3hub'].get('loop',
+        'asyncio'))
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(i3hub_main(loop, args, spawner, config,
+        log_buffer))
     loop.close()
 
 
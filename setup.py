@@ -26,6 +26,7 @@ setup(
     download_url='{0}/archive/{1}.tar.gz'.format(REPO, VERSION),
     license='MIT',
     install_requires=['pyxdg'],
+    extras_require={'uvloop': ['uvloop']},
     entry_points='''
     [console_scripts]
     i3hub=i3hub:main
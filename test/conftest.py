@@ -1,12 +1,13 @@
 import asyncio
 import inspect
+import os
 
 import pytest
 
 from .mock import I3Mock, I3BarMock
 from . import extension
 from .util import spin, stream_pipe, i3msg
-from ..i3hub import I3Connection, I3Hub
+from ..i3hub import I3Connection, I3Hub, LazyExtension, new_event_loop
 
 
 class I3(object):
@@ -26,6 +27,11 @@ class I3(object):
         self._all_run_task = None
         self._extensions = extensions
         self._run_i3hub = run_i3hub
+        self._reconnect_tasks = []
+        self._reconnect_fobjs = []
+        self._old_mocks = []
+        # subscribe request expected on connections created by the hub
+        self.subscribe_request = '["binding","shutdown","window"]'
 
     async def setup(self, loop):
         # 2 pipes for communication between I3Connection and I3Mock
@@ -42,22 +48,45 @@ class I3(object):
                 await stream_pipe(loop))
         self.barmock = I3BarMock(loop, breader, bwriter)
         self.hub = I3Hub(loop, self.conn, hreader, hwriter, self._extensions,
-                config={}, status_output_sort_keys=True)
+                config={}, status_output_sort_keys=True,
+                connect_cb=self.reconnect)
         tasks = [self.barmock.run(), self.mock.run()]
         if self._run_i3hub:
             # tell I3Mock to expect and reply to a subscribe request from I3Hub
             self.mock.expect_request(
-                    i3msg(2, '["window","shutdown"]'),
+                    i3msg(2, '["binding","shutdown","window"]'),
                     i3msg(2, '{"success":true}'))
             tasks.append(self.hub.run())
         self._all_run_task = asyncio.ensure_future(asyncio.gather(*tasks))
         if self._run_i3hub:
             await spin()
 
+    async def reconnect(self):
+        # simulate a new connection, either to the new i3 process after an
+        # in-place restart or to resubscribe: replace the mock and expect the
+        # hub to subscribe again
+        loop = asyncio.get_event_loop()
+        mreader, mreader_fobj, cwriter, cwriter_fobj = await stream_pipe(loop)
+        creader, creader_fobj, mwriter, mwriter_fobj = await stream_pipe(loop)
+        self._reconnect_fobjs.extend([mreader_fobj, cwriter_fobj,
+            creader_fobj, mwriter_fobj])
+        self._old_mocks.append(self.mock)
+        self.mock = I3Mock(loop, mreader, mwriter)
+        self.mock.expect_request(i3msg(2, self.subscribe_request),
+                i3msg(2, '{"success":true}'))
+        self._reconnect_tasks.append(asyncio.ensure_future(self.mock.run()))
+        self.conn = I3Connection(loop, creader, cwriter)
+        return self.conn
+
     async def teardown(self, loop):
         self.mock.close()
+        for mock in self._old_mocks:
+            mock.close()
         self.barmock.close()
         await self._all_run_task
+        await asyncio.gather(*self._reconnect_tasks)
+        for fobj in self._reconnect_fobjs:
+            fobj.close()
         # ensure all pipe file descriptors are closed
         self._mreader_fobj.close()
         self._mwriter_fobj.close()
@@ -69,11 +98,33 @@ class I3(object):
         self._hwriter_fobj.close()
 
 
+def pytest_addoption(parser):
+    # eg: "pytest --loop uvloop" runs the tests on uvloop
+    parser.addoption('--loop', default='asyncio',
+            choices=('asyncio', 'uvloop'))
+
+
+@pytest.fixture
+def event_loop(request):
+    loop = new_event_loop(request.config.getoption('--loop'))
+    yield loop
+    loop.close()
+
+
 @pytest.fixture
 def i3(request, event_loop):
     run_i3hub = getattr(request.module, 'run_i3hub', False)
-    i3 = I3([('extension', extension), ('mod', extension.ModuleExtension())],
-            run_i3hub)
+    extensions = [('extension', extension),
+            ('mod', extension.ModuleExtension())]
+    # modules of the test package that are only loaded when their declared
+    # events are dispatched
+    package = extension.__name__.rsplit('.', 1)[0]
+    for name, events in getattr(request.module, 'lazy_extensions', {}).items():
+        path = os.path.join(os.path.dirname(extension.__file__),
+                name + '.py')
+        extensions.append((name, LazyExtension('{}.{}'.format(package, name),
+            path, events)))
+    i3 = I3(extensions, run_i3hub)
     event_loop.run_until_complete(i3.setup(event_loop))
     yield i3
     event_loop.run_until_complete(i3.teardown(event_loop))
@@ -104,6 +155,12 @@ def i3api(i3hub):
     return i3hub._i3api
 
 
+@pytest.fixture
+def extension_api(i3hub):
+    # each extension receives its own API object
+    return i3hub._extension_api
+
+
 def search_extension_instance_events(i3hub, name):
     for handlers in i3hub._event_handlers.values():
         for handler in handlers:
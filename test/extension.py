@@ -1,4 +1,6 @@
-from ..i3hub import extension, listen 
+import asyncio
+
+from ..i3hub import extension, listen, click, nop
 
 
 class Extension(object):
@@ -18,6 +20,12 @@ class I3Events(Extension):
     async def event_handler(self, event, arg):
         self._record_event(event, arg)
 
+    def suspend_window(self):
+        self._i3.suspend_event('window')
+
+    async def resume_window(self):
+        await self._i3.resume_event('window')
+
 
 @extension(name='status')
 class StatusEvents(Extension):
@@ -33,6 +41,11 @@ class StatusEvents(Extension):
     async def event_handler(self, event, arg):
         self._record_event(event, arg)
 
+    @click('owned')
+    @click('owned-instance', 'x')
+    async def click_handler(self, event, arg):
+        self._record_event('owned', arg)
+
     @listen('i3hub::init')
     async def init_handler(self, event, arg):
         self._i3.refresh_i3bar()
@@ -57,6 +70,33 @@ class ExtensionEvents(Extension):
         self._record_event(event, arg)
         arg.append('extension-data')
 
+    @nop('test-verb')
+    @nop('test-verb-2')
+    async def nop_handler(self, event, arg):
+        self._record_event(event, arg)
+
+
+@extension(name='dependent')
+class DependentInit(Extension):
+    _I3HUB_REQUIRES = ('slow',)
+
+    @listen('i3hub::init')
+    async def init_handler(self, event, arg):
+        self._record_event(event, self._i3.require('slow').initialized)
+
+
+@extension(name='slow')
+class SlowInit(Extension):
+    initialized = False
+
+    @listen('i3hub::init')
+    @listen('i3::window')
+    async def event_handler(self, event, arg):
+        if event == 'i3hub::init':
+            await asyncio.sleep(0.05)
+            self.initialized = True
+        self._record_event(event, None)
+
 
 class ModuleExtension(object):
     def __init__(self):
@@ -0,0 +1,18 @@
+import asyncio
+
+from ..i3hub import listen
+
+
+events = []
+
+
+@listen('i3hub::init')
+async def init_handler(i3, event, arg):
+    events.append(event)
+    await asyncio.sleep(60)
+    events.append('initialized')
+
+
+@listen('extension::hung-event')
+async def event_handler(i3, event, arg):
+    events.append(event)
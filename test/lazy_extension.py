@@ -0,0 +1,15 @@
+from ..i3hub import listen, nop
+
+
+events = []
+
+
+@listen('i3hub::init')
+@listen('i3::window')
+async def event_handler(i3, event, arg):
+    events.append((event, arg))
+
+
+@nop('lazy-verb')
+async def nop_handler(i3, event, arg):
+    events.append((event, arg))
@@ -0,0 +1,25 @@
+import asyncio
+
+from ..i3hub import click, listen
+
+
+initialized = False
+events = []
+
+
+@listen('i3hub::init')
+async def init_handler(i3, event, arg):
+    global initialized
+    await asyncio.sleep(0.05)
+    initialized = True
+
+
+@listen('i3hub::i3bar_refresh')
+@listen('extension::slow-event')
+async def event_handler(i3, event, arg):
+    events.append((event, initialized))
+
+
+@click('slow')
+async def click_handler(i3, event, arg):
+    events.append((event, initialized))
@@ -0,0 +1,277 @@
+import asyncio
+import concurrent.futures
+import errno
+import os
+import threading
+import pytest
+
+from .util import load_contrib
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture(scope='module')
+def hs():
+    return load_contrib('hub_status')
+
+
+class I3(object):
+    def __init__(self, loop):
+        self.event_loop = loop
+
+
+@pytest.fixture
+def status(hs, event_loop):
+    status = hs.HubStatus(I3(event_loop))
+    status._executor = concurrent.futures.ThreadPoolExecutor(1)
+    yield status
+    status._executor.shutdown()
+
+
+async def test_stale_widget_recovers(hs, status):
+    status._probe_timeout = 0.05
+    status._widget_order = {'fake': 0}
+    hung = threading.Event()
+    results = iter(['first', None, 'third'])
+    def _fake(now):
+        text = next(results)
+        if text is None:
+            hung.wait()
+            text = 'second'
+        return {'name': 'fake', 'markup': 'pango', 'full_text': text}
+    update = status._updater(_fake)
+    assert await update()
+    assert status._current_status == [
+        {'name': 'fake', 'markup': 'pango', 'full_text': 'first'}]
+    # the probe times out and the last block is rendered as stale
+    assert await update()
+    assert status._current_status == [{'name': 'fake', 'markup': 'pango',
+        'full_text': 'first', 'color': hs.STALE_COLOR}]
+    hung.set()
+    await asyncio.sleep(0.05)
+    # the next fresh block replaces the stale one
+    assert await update()
+    assert status._current_status == [
+        {'name': 'fake', 'markup': 'pango', 'full_text': 'third'}]
+
+
+async def test_failed_widget_without_last_block(hs, status):
+    status._probe_timeout = 1
+    status._widget_order = {'fake': 0}
+    def _fake(now):
+        raise OSError('no such device')
+    assert await status._updater(_fake)()
+    assert status._current_status == [
+        {'name': 'fake', 'markup': 'none', 'full_text': '?'}]
+
+
+class BrokenSocket(object):
+    def __init__(self, fd):
+        self._fd = fd
+
+    def fileno(self):
+        return self._fd
+
+    def recv(self, size):
+        raise OSError(errno.EBADF, 'Bad file descriptor')
+
+
+async def test_network_state_not_cached_after_monitor_stops(hs, status,
+        event_loop):
+    r, w = os.pipe()
+    try:
+        monitor = object.__new__(hs.NetlinkMonitor)
+        monitor._loop = event_loop
+        monitor._callback = status._on_route_event
+        monitor._sock = BrokenSocket(r)
+        monitor._reading = True
+        status._route_monitor = monitor
+        status._net_state = 'cached'
+        monitor._read()
+        assert not monitor.active
+        # the cached state is dropped and never stored again
+        assert status._net_state is None
+        assert status._network_state() != 'cached'
+        assert status._net_state is None
+    finally:
+        os.close(r)
+        os.close(w)
+
+
+STAT = ('cpu  {} 0 {} {} {} 0 0 0 0 0\n'
+        'cpu0 1 2 3 4 5 6 7 8 0 0\n'
+        'intr 12345\n')
+
+
+async def test_cpu_collector(hs, tmpdir):
+    stat = tmpdir.join('stat')
+    # user system idle iowait
+    stat.write(STAT.format(100, 100, 700, 100))
+    collector = hs.CpuCollector(str(stat))
+    try:
+        # the baseline was taken when the collector was created
+        stat.write(STAT.format(130, 120, 740, 110))
+        assert collector.percent() == 50.0
+        # no time passed
+        assert collector.percent() == 0.0
+    finally:
+        collector.close()
+
+
+MEMINFO = '''MemTotal:        8000000 kB
+MemFree:         1000000 kB
+{}Buffers:          500000 kB
+Cached:          1500000 kB
+SwapCached:        10000 kB
+'''
+
+
+async def test_memory_collector(hs, tmpdir):
+    meminfo = tmpdir.join('meminfo')
+    meminfo.write(MEMINFO.format('MemAvailable:    4000000 kB\n'))
+    collector = hs.MemoryCollector(str(meminfo))
+    try:
+        assert collector.total_available() == (8000000 * hs.KB,
+                4000000 * hs.KB)
+        # without MemAvailable, free memory plus buffers and page cache
+        meminfo.write(MEMINFO.format(''))
+        assert collector.total_available() == (8000000 * hs.KB,
+                3000000 * hs.KB)
+    finally:
+        collector.close()
+
+
+NET_DEV = '''Inter-|   Receive                                                |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed
+    lo:    1000      10    0    0    0     0          0         0     1000      10    0    0    0     0       0          0
+ veth0:     111       1    0    0    0     0          0         0      222       2    0    0    0     0       0          0
+  eth0: 5000000    4000    0    0    0     0          0         0   600000    3000    0    0    0     0       0          0
+'''
+
+
+async def test_net_dev_collector(hs, tmpdir):
+    net_dev = tmpdir.join('dev')
+    net_dev.write(NET_DEV)
+    collector = hs.NetDevCollector(str(net_dev))
+    try:
+        # "eth0" must not match the end of "veth0"
+        assert collector.counters('eth0') == (5000000, 600000)
+        assert collector.counters('veth0') == (111, 222)
+        assert collector.counters('wlan0') is None
+    finally:
+        collector.close()
+
+
+async def test_battery_collector(hs, tmpdir):
+    battery = tmpdir.mkdir('BAT0')
+    battery.join('type').write('Battery\n')
+    battery.join('capacity').write('42\n')
+    battery.join('status').write('Discharging\n')
+    mains = tmpdir.mkdir('AC')
+    mains.join('type').write('Mains\n')
+    mains.join('online').write('0\n')
+    collector = hs.BatteryCollector(str(tmpdir))
+    try:
+        state = collector.state()
+        assert (state.percent, state.power_plugged) == (42, False)
+        mains.join('online').write('1\n')
+        state = collector.state()
+        assert (state.percent, state.power_plugged) == (42, True)
+    finally:
+        collector.close()
+
+
+async def test_ring_buffer(hs):
+    ring = hs.RingBuffer(3)
+    assert len(ring) == 0 and list(ring) == [] and ring.max() == 0.0
+    ring.append(1)
+    ring.append(5)
+    assert list(ring) == [1.0, 5.0] and ring.max() == 5.0
+    ring.append(2)
+    ring.append(3)
+    # the oldest sample was overwritten
+    assert len(ring) == 3
+    assert list(ring) == [5.0, 2.0, 3.0]
+    ring.append(1)
+    assert list(ring) == [2.0, 3.0, 1.0] and ring.max() == 3.0
+
+
+async def test_metric_ewma(hs):
+    metric = hs.Metric(4, 0.5)
+    # the first sample is taken as is
+    assert metric.add(10) == 10
+    assert metric.add(20) == 15
+    assert metric.add(15) == 15
+    assert list(metric.history) == [10.0, 20.0, 15.0]
+
+
+async def test_sparkline(hs):
+    ring = hs.RingBuffer(4)
+    for value in (0, 25, 50, 100):
+        ring.append(value)
+    chars = hs.SPARKLINE_CHARS
+    assert hs.sparkline(ring) == chars[0] + chars[1] + chars[3] + chars[7]
+    # values are clamped to the given maximum
+    assert hs.sparkline(ring, 50) == chars[0] + chars[3] + chars[7] + chars[7]
+    empty = hs.RingBuffer(2)
+    empty.append(0)
+    assert hs.sparkline(empty) == chars[0]
+
+
+class Timer(object):
+    def __init__(self):
+        self.intervals = []
+
+    def set_interval(self, interval):
+        self.intervals.append(interval)
+
+
+async def test_adapt_interval(hs, status):
+    timer = status._timers['cpu'] = Timer()
+    status._intervals['cpu'] = [5, 30, 5]
+    for changed in (False, False, False, False, True, False):
+        status._adapt_interval('cpu', changed)
+    # unchanged widgets back off up to the maximum, changes reset it
+    assert timer.intervals == [10, 20, 30, 30, 5, 10]
+    status._on_battery = True
+    status._on_battery_factor = 3
+    status._adapt_interval('cpu', False)
+    status._adapt_interval('cpu', True)
+    assert timer.intervals[-2:] == [60, 15]
+    # the scaled interval is not remembered as the next base interval
+    assert status._intervals['cpu'] == [5, 30, 5]
+
+
+async def test_changed_uses_value_tolerance(hs, status):
+    def changed(name, value, text='text'):
+        status._values[name] = value
+        block = {'name': name, 'full_text': text}
+        return status._changed(name, block, block)
+    assert changed('cpu', 10)
+    # the text changes with every sample, but the value barely moves
+    assert not changed('cpu', 13)
+    assert not changed('cpu', 7)
+    assert changed('cpu', 16)
+    assert changed('memory', 0.5)
+    assert not changed('memory', 0.51)
+    assert changed('memory', 0.53)
+    assert changed('network', 100 * hs.KB)
+    assert not changed('network', 120 * hs.KB)
+    assert changed('network', 130 * hs.KB)
+    # small rates are noise
+    assert changed('network', 0)
+    assert not changed('network', 200)
+    # widgets without a value compare their text
+    last = {'name': 'date', 'full_text': 'a'}
+    assert not status._changed('date', last, dict(last))
+    assert status._changed('date', last, dict(last, full_text='b'))
+
+
+async def test_interval_bounds(hs):
+    assert hs.interval_bounds('cpu', None, (5, 30)) == (5, 30)
+    assert hs.interval_bounds('cpu', [2, 10], (5, 30)) == (2, 10)
+    # timers run at most once per second
+    assert hs.interval_bounds('cpu', [0, 0.5], (5, 30)) == (1, 1)
+    assert hs.interval_bounds('cpu', [10, 5], (5, 30)) == (10, 10)
+    assert hs.interval_bounds('cpu', 'fast', (5, 30)) == (5, 30)
+    assert hs.interval_bounds('cpu', [1, 2, 3], (5, 30)) == (5, 30)
@@ -1,54 +1,75 @@
 import asyncio
+import collections
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
 import pytest
 
-from .util import i3event, spin
+from . import extension
+from .util import i3event, i3msg, spin
+from ..i3hub import (I3BarWriter, Scheduler, RawBlocks, StatusArray,
+        encode_status_array, status_array_merge, ClickEventDecoder,
+        pop_click_event,
+        DiscoveryCache, describe_extension, find_extension, get_socket_path,
+        load_config, exec_extension_module, Inotify, LogManager,
+        RateLimitFilter, buffer_logging, describes)
 
 pytestmark = pytest.mark.asyncio
 run_i3hub = True
 
 
-async def test_module_init_event(i3api, moduleevents):
-    assert moduleevents == [(i3api, 'i3hub::init', {
+async def test_module_init_event(moduleevents, extension_api):
+    api = extension_api('mod')
+    assert moduleevents == [(api, 'i3hub::init', {
         'running_as_status': True,
         'config': {}
         })]
 
 
-async def test_init_event(i3api, i3events):
-    assert i3events == [(i3api, 'i3hub::init', {
+async def test_init_event(i3events, extension_api):
+    api = extension_api('i3')
+    assert i3events == [(api, 'i3hub::init', {
         'running_as_status': True,
         'config': {}
         })]
 
 
-async def test_module_i3_events(i3api, i3mock, moduleevents):
+async def test_module_i3_events(i3mock, moduleevents, extension_api):
+    api = extension_api('mod')
     i3mock.send_event(i3event(3, '[1]'))
     await spin()
     i3mock.send_event(i3event(3, '[2]'))
     await spin()
     i3mock.send_event(i3event(3, '[3]'))
     await spin()
-    assert moduleevents[1] == (i3api, 'i3::window', [1])
-    assert moduleevents[2] == (i3api, 'i3::window', [2])
-    assert moduleevents[3] == (i3api, 'i3::window', [3])
+    assert moduleevents[1] == (api, 'i3::window', [1])
+    assert moduleevents[2] == (api, 'i3::window', [2])
+    assert moduleevents[3] == (api, 'i3::window', [3])
 
 
-async def test_i3_events(i3api, i3mock, i3events):
+async def test_i3_events(i3mock, i3events, extension_api):
+    api = extension_api('i3')
     i3mock.send_event(i3event(3, '[1]'))
     await spin()
     i3mock.send_event(i3event(3, '[2]'))
     await spin()
     i3mock.send_event(i3event(3, '[3]'))
     await spin()
-    assert i3events[1] == (i3api, 'i3::window', [1])
-    assert i3events[2] == (i3api, 'i3::window', [2])
-    assert i3events[3] == (i3api, 'i3::window', [3])
+    assert i3events[1] == (api, 'i3::window', [1])
+    assert i3events[2] == (api, 'i3::window', [2])
+    assert i3events[3] == (api, 'i3::window', [3])
 
 
-async def test_shutdown_event_closes_i3hub(i3api, i3mock, i3hub, i3events):
+async def test_shutdown_event_closes_i3hub(i3mock, i3hub, i3events,
+        extension_api):
+    api = extension_api('i3')
     i3mock.send_event(i3event(6, '[1,2]'))
     await spin()
-    assert i3events[1] == (i3api, 'i3::shutdown', [1, 2])
+    assert i3events[1] == (api, 'i3::shutdown', [1, 2])
     # new events are ignored
     i3mock.send_event(i3event(3, '[1]'))
     await spin()
@@ -58,10 +79,73 @@ async def test_shutdown_event_closes_i3hub(i3api, i3mock, i3hub, i3events):
         await i3hub.run()
 
 
-async def test_shutdown_through_closed_connection(i3api, i3mock, i3events):
+async def test_reconnect_on_restart(i3, i3api, i3mock, i3events,
+        extension_api):
+    api = extension_api('i3')
+    i3mock.send_event(i3event(6, '{"change":"restart"}'))
+    await asyncio.sleep(0.05)
+    assert i3.mock is not i3mock
+    assert i3api._conn is i3.conn
+    i3.mock.verify()
+    # extensions are kept alive and receive events from the new connection
+    i3.mock.send_event(i3event(3, '[1]'))
+    await spin()
+    assert i3events[1:] == [(api, 'i3::window', [1])]
+
+
+async def test_suspend_and_resume_event(i3, i3api, i3events,
+        extension_api):
+    api = extension_api('i3')
+    i3.hub._config = {'i3hub': {'resubscribe_delay': 0}}
+    i3.subscribe_request = '["binding","shutdown"]'
+    old_mock = i3.mock
+    owners = [owner for owner, events in i3.hub._i3_interest.items()
+            if 'window' in events]
+    for owner in owners:
+        i3.hub.suspend_event('window', owner)
+    await asyncio.sleep(0.05)
+    # i3 can't unsubscribe, so the hub moved to a new connection
+    assert i3.mock is not old_mock
+    assert i3api._conn is i3.conn and api._conn is i3.conn
+    i3.mock.verify()
+    # i3 closes its end when the hub closes the old connection
+    old_mock.close()
+    i3.mock.expect_request(i3msg(2, '["window"]'),
+            i3msg(2, '{"success":true}'))
+    await api.resume_event('window')
+    i3.mock.verify()
+    i3.mock.send_event(i3event(3, '[1]'))
+    await spin()
+    assert i3events[1:] == [(api, 'i3::window', [1])]
+    with pytest.raises(Exception):
+        api.suspend_event('invalid')
+    # the interest of the hub itself can't be changed
+    with pytest.raises(Exception):
+        i3api.suspend_event('shutdown')
+    assert i3.hub._i3_interest[None] == {'shutdown'}
+
+
+async def test_suspend_event_is_tracked_per_extension(i3, i3hub):
+    i3hub._config = {'i3hub': {'resubscribe_delay': 0}}
+    old_mock = i3.mock
+    # calls are attributed to the extension that makes them, and suspending
+    # twice doesn't withdraw the interest of other extensions
+    i3hub._registered_extensions['i3'].suspend_window()
+    i3hub._registered_extensions['i3'].suspend_window()
+    assert 'window' not in i3hub._i3_interest['i3']
+    assert 'window' in i3hub._i3_interest['slow']
+    await spin()
+    assert i3.mock is old_mock
+    await i3hub._registered_extensions['i3'].resume_window()
+    assert 'window' in i3hub._i3_interest['i3']
+
+
+async def test_shutdown_through_closed_connection(i3mock, i3events,
+        extension_api):
+    api = extension_api('i3')
     i3mock.close()
     await spin()
-    assert i3events[1] == (i3api, 'i3::shutdown', 'eof')
+    assert i3events[1] == (api, 'i3::shutdown', 'eof')
 
 
 async def test_i3bar_initial_data(i3barmock):
@@ -89,32 +173,446 @@ async def test_get_and_update_status(i3barmock, i3api):
     i3barmock.verify()
 
 
-async def test_i3bar_click_event(i3barmock, i3api, statusevents):
+async def test_i3bar_click_event(i3barmock, statusevents, extension_api):
+    api = extension_api('status')
     i3barmock.send_click(b'[\n[1,2,3]\n')
     await spin()
     assert len(statusevents) == 1
-    assert statusevents[0] == (i3api, 'i3hub::i3bar_click', [1,2,3])
+    assert statusevents[0] == (api, 'i3hub::i3bar_click', [1,2,3])
     i3barmock.send_click(b',["click!"]\n')
     await spin()
-    assert statusevents[1] == (i3api, 'i3hub::i3bar_click', ['click!'])
+    assert statusevents[1] == (api, 'i3hub::i3bar_click', ['click!'])
     i3barmock.send_click(b',[""]\n')
     await spin()
-    assert statusevents[2] == (i3api, 'i3hub::i3bar_click', [''])
+    assert statusevents[2] == (api, 'i3hub::i3bar_click', [''])
 
 
-async def test_i3bar_stop_cont_events(i3hub, i3api, statusevents):
+async def test_i3bar_click_routing(i3barmock, statusevents, extension_api):
+    api = extension_api('status')
+    i3barmock.send_click(b'[\n{"name":"owned","instance":"y"}\n')
+    await spin()
+    i3barmock.send_click(b',{"name":"owned-instance","instance":"x"}\n')
+    await spin()
+    i3barmock.send_click(b',{"name":"owned-instance","instance":"y"}\n')
+    await spin()
+    assert statusevents == [
+        (api, 'owned', {'name': 'owned', 'instance': 'y'}),
+        (api, 'owned', {'name': 'owned-instance', 'instance': 'x'}),
+        (api, 'i3hub::i3bar_click', {'name': 'owned-instance',
+            'instance': 'y'}),
+    ]
+
+
+async def test_i3bar_stop_cont_events(i3hub, statusevents, extension_api):
+    api = extension_api('status')
     await i3hub.dispatch_stop()
     await spin()
-    assert statusevents[0] == (i3api, 'i3hub::i3bar_suspend', None)
+    assert statusevents[0] == (api, 'i3hub::i3bar_suspend', None)
     await i3hub.dispatch_cont()
     await spin()
-    assert statusevents[1] == (i3api, 'i3hub::i3bar_resume', None)
+    assert statusevents[1] == (api, 'i3hub::i3bar_resume', None)
 
 
-async def test_extension_event(i3api, extensionevents):
+async def test_extension_event(i3api, extensionevents, extension_api):
+    api = extension_api('events')
     assert extensionevents == []
     arg = []
     await i3api.emit_event('some_extension::custom', arg)
-    assert extensionevents[0] == (i3api, 'extension::some_extension::custom',
+    assert extensionevents[0] == (api, 'extension::some_extension::custom',
             arg)
     assert arg == ['extension-data']
+
+
+class FakeTransport(object):
+    def __init__(self):
+        self.buffer_size = 0
+
+    def set_write_buffer_limits(self, high=None, low=None):
+        pass
+
+    def get_write_buffer_size(self):
+        return self.buffer_size
+
+
+class FakeWriter(object):
+    def __init__(self, loop):
+        self.transport = FakeTransport()
+        self.written = []
+        self.drained = asyncio.Future(loop=loop)
+
+    def write(self, data):
+        self.written.append(data)
+
+    async def drain(self):
+        await self.drained
+
+
+async def test_i3bar_writer_latest_frame_wins(event_loop):
+    writer = FakeWriter(event_loop)
+    i3bar = I3BarWriter(event_loop, writer, high_water=10)
+    assert i3bar.write_frame(b'[1]\n')
+    writer.transport.buffer_size = 11
+    assert not i3bar.write_frame(b'[2]\n')
+    assert not i3bar.write_frame(b'[3]\n')
+    assert writer.written == [b'[1]\n']
+    assert i3bar.stats == {'written': 1, 'superseded': 1, 'dropped': 0,
+            'pending': True}
+    writer.transport.buffer_size = 0
+    writer.drained.set_result(None)
+    await spin()
+    assert writer.written == [b'[1]\n', b',[3]\n']
+    assert i3bar.stats == {'written': 2, 'superseded': 1, 'dropped': 0,
+            'pending': False}
+
+
+async def test_scheduler_batches_timers(event_loop):
+    refreshes = []
+    calls = []
+    scheduler = Scheduler(event_loop, lambda: refreshes.append(None))
+
+    def sync_timer():
+        calls.append('sync')
+        return True
+
+    async def async_timer():
+        calls.append('async')
+        return False
+
+    t1 = scheduler.every(5, sync_timer)
+    t2 = scheduler.every(2, async_timer)
+    await spin()
+    assert calls == ['sync', 'async']
+    # both timers ran in the same batch, so only one refresh is requested
+    assert refreshes == [None]
+    # next runs are aligned to multiples of the interval
+    assert t1.due % 5 == 0 and t1.due > time.time()
+    assert t2.due % 2 == 0 and t2.due > time.time()
+    t1.set_interval(7)
+    assert t1.due % 7 == 0 and t1.due > time.time()
+    scheduler.close()
+
+
+async def test_raw_blocks_are_spliced():
+    raw = RawBlocks(b'[{"name":"a","full_text":"A"},{"name":"b"}]\n')
+    assert encode_status_array([{'name': 'x'}, raw, RawBlocks(b'[]')]) == (
+            b'[{"name":"x"},{"name":"a","full_text":"A"},{"name":"b"}]')
+    status_array = [raw]
+    status_array_merge(status_array, {'name': 'c'})
+    assert status_array == [{'name': 'c'}, raw]
+    status_array_merge(status_array, {'name': 'a', 'full_text': 'B'})
+    assert status_array == [{'name': 'c'}, {'name': 'a', 'full_text': 'B'},
+            {'name': 'b'}]
+    # the decoded blocks are copies, the raw data is left untouched
+    assert raw.blocks[0] == {'name': 'a', 'full_text': 'A'}
+
+
+async def test_status_array_decodes_raw_blocks_when_read():
+    raw = RawBlocks(b'[{"name":"a","full_text":"A"}]')
+    status_array = StatusArray([{'name': 'x'}])
+    status_array.append_raw(raw)
+    status_array.append({'name': 'y'})
+    status_array_merge(status_array, {'name': 'x', 'full_text': 'X'})
+    # merging a block that is not raw and encoding keep the raw data
+    assert list.__getitem__(status_array, 1) is raw
+    assert encode_status_array(status_array) == (
+        b'[{"name":"x","full_text":"X"},{"name":"a","full_text":"A"},'
+        b'{"name":"y"}]')
+    assert encode_status_array(status_array, sort_keys=True) == (
+        b'[{"full_text":"X","name":"x"},{"full_text":"A","name":"a"},'
+        b'{"name":"y"}]')
+    # handlers that read the array only see plain blocks
+    assert [block['name'] for block in status_array] == ['x', 'a', 'y']
+    assert status_array[1].get('full_text') == 'A'
+    status_array[1]['full_text'] = 'B'
+    assert raw.blocks[0]['full_text'] == 'A'
+    assert encode_status_array(status_array) == (
+        b'[{"name":"x","full_text":"X"},{"name":"a","full_text":"B"},'
+        b'{"name":"y"}]')
+
+
+async def test_click_event_decoder_handles_chunks():
+    decoder = ClickEventDecoder()
+    assert decoder.feed(b'[\n{"name":"a"') == ([], [])
+    assert decoder.feed(b',"x":"}\\"]"}\n,{') == ([{'name': 'a', 'x': '}"]'}],
+            [])
+    assert decoder.feed(b'"name" : "b"}  ,\n[1]\n,{bad}\n') == (
+            [{'name': 'b'}, [1]], ['{bad}'])
+    # multibyte characters split across chunks
+    data = '{"name":"ç"}\n'.encode('utf-8')
+    assert decoder.feed(b',' + data[:10]) == ([], [])
+    assert decoder.feed(data[10:]) == ([{'name': 'ç'}], [])
+
+
+async def test_scroll_clicks_are_coalesced():
+    up = {'name': 'volume', 'instance': 'x', 'button': 4}
+    down = dict(up, button=5)
+    queue = collections.deque([up, up, up, down, {'name': 'a', 'button': 1},
+        {'name': 'a', 'button': 1}])
+    assert pop_click_event(queue, True) == dict(up, repeat=3)
+    assert pop_click_event(queue, True) == down
+    assert pop_click_event(queue, True) == {'name': 'a', 'button': 1}
+    assert pop_click_event(queue, True) == {'name': 'a', 'button': 1}
+    queue.extend([up, up])
+    assert pop_click_event(queue) == up
+    assert len(queue) == 1
+
+
+async def test_nop_binding_routing(i3mock, extensionevents, extension_api):
+    api = extension_api('events')
+    def binding(command, change='run'):
+        return i3event(5, json.dumps({'change': change,
+            'binding': {'command': command}}))
+    i3mock.send_event(binding('nop test-verb a "b c"'))
+    await spin()
+    i3mock.send_event(binding('  nop   test-verb-2'))
+    await spin()
+    i3mock.send_event(binding('nop test-verb-3'))
+    await spin()
+    i3mock.send_event(binding('exec nop test-verb'))
+    await spin()
+    assert extensionevents == [
+        (api, 'nop::test-verb', ['a', 'b c']),
+        (api, 'nop::test-verb-2', []),
+    ]
+
+
+async def test_init_waits_for_required_extensions(i3api, i3mock,
+        extension_api):
+    slow = i3api.require('slow')
+    dependent = i3api.require('dependent')
+    # the window event is only dispatched to "slow" after it is initialized
+    i3mock.send_event(i3event(3, '[1]'))
+    await spin()
+    assert slow._events == [] and dependent._events == []
+    await asyncio.sleep(0.1)
+    assert slow._events == [
+        (extension_api('slow'), 'i3hub::init', None),
+        (extension_api('slow'), 'i3::window', None),
+    ]
+    assert dependent._events == [
+        (extension_api('dependent'), 'i3hub::init', True)]
+
+
+async def test_discovery_cache(tmpdir):
+    ext_dir = tmpdir.mkdir('extensions')
+    module = ext_dir.join('ext.py')
+    module.write('')
+    cache_path = str(tmpdir.join('discovery.json'))
+    description = describe_extension(extension)
+    assert ['I3Events', 'i3'] in description['classes']
+    assert description['handlers']['I3Events'] == [
+        ['event_handler', ['i3::shutdown', 'i3::window', 'i3hub::init'], [],
+            []]
+    ]
+    cache = DiscoveryCache(cache_path)
+    assert cache.lookup(str(module)) is None
+    cache.store(str(module), description)
+    assert cache.resolve('ext', [str(ext_dir)], find_extension) == [
+        str(module)]
+    cache.save()
+    cache = DiscoveryCache(cache_path)
+    assert cache.lookup(str(module)) == description
+    # searches are not repeated while the directories are unchanged
+    assert cache.resolve('ext', [str(ext_dir)], None) == [str(module)]
+    module.write('# changed')
+    assert cache.lookup(str(module)) is None
+    assert cache.resolve('ext2', [str(ext_dir)], find_extension) == []
+    # creating a file changes the directory mtime, which is forced here since
+    # timestamps can be coarse
+    ext_dir.join('ext2.py').write('')
+    os.utime(str(ext_dir), ns=(0, 0))
+    assert cache.resolve('ext2', [str(ext_dir)], find_extension) == [
+        str(ext_dir.join('ext2.py'))]
+    # packages are also invalidated when one of their submodules changes
+    package = ext_dir.mkdir('pkg')
+    package.join('__init__.py').write('')
+    package.join('handlers.py').write('')
+    init_path = str(package.join('__init__.py'))
+    cache.store(init_path, description)
+    assert cache.lookup(init_path) == description
+    package.join('handlers.py').write('# changed')
+    assert cache.lookup(init_path) is None
+    # and descriptions are checked against the extension before being used
+    assert describes(extension, description)
+    stale = dict(description, handlers=dict(description['handlers'],
+        I3Events=[['renamed_handler', ['i3::window'], [], []]]))
+    assert not describes(extension, stale)
+
+
+async def test_socket_discovery(tmpdir, monkeypatch):
+    monkeypatch.setenv('I3SOCK', '/run/i3.sock')
+    assert get_socket_path() == '/run/i3.sock'
+    monkeypatch.delenv('I3SOCK')
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmpdir))
+    i3_dir = tmpdir.mkdir('i3')
+    # sockets of processes that don't exist are ignored
+    i3_dir.join('ipc-socket.{}'.format(2 ** 22 + 1)).write('')
+    i3_dir.join('ipc-socket.{}'.format(os.getpid())).write('')
+    assert get_socket_path() == str(i3_dir.join('ipc-socket.{}'.format(
+        os.getpid())))
+
+
+async def test_load_config_snapshot(tmpdir, caplog):
+    config_path = tmpdir.join('i3hub.cfg')
+    config_path.write('\n'.join([
+        '[i3hub]',
+        'extensions = ["a", "b"]',
+        '[ext]',
+        'name = plain string',
+        'workspaces = {"1": {"commands": ["exec a"]}}',
+        'path = ${name}/x',
+        'broken = [1,',
+    ]))
+    extra = tmpdir.mkdir('config.d')
+    extra.join('c.cfg').write('[i3hub]\nextensions_append = ["c"]\n')
+    config, extensions = load_config(str(config_path), [str(extra)])
+    assert extensions == ['a', 'b', 'c']
+    ext = config['ext']
+    assert ext['name'] == 'plain string'
+    assert ext['path'] == 'plain string/x'
+    assert ext['workspaces']['1']['commands'] == ('exec a',)
+    assert ext['broken'] == '[1,'
+    assert caplog.text.count('invalid JSON') == 1
+    with pytest.raises(TypeError):
+        ext['workspaces']['2'] = {}
+
+
+async def test_rate_limit_filter():
+    limit = RateLimitFilter(burst=2, interval=60)
+    def record(created, element):
+        record = logging.LogRecord('i3hub', logging.WARNING, __file__, 1,
+                'failed to parse click event: %s', (element,), None)
+        record.created = created
+        return record
+    assert [limit.filter(record(0, i)) for i in range(4)] == [
+            True, True, False, False]
+    assert limit.filter(record(10, 'other')) is False
+    last = record(60, 'x')
+    assert limit.filter(last)
+    assert last.getMessage() == (
+            'failed to parse click event: x (3 similar messages suppressed)')
+    # groups that expire without a new record report their count separately
+    reported = []
+    limit.report = reported.append
+    assert limit.filter(record(61, 'y'))
+    assert not limit.filter(record(62, 'z'))
+    other = logging.LogRecord('i3hub', logging.WARNING, __file__, 1,
+            'other message', (), None)
+    other.created = 130
+    assert limit.filter(other)
+    assert [r.getMessage() for r in reported] == [
+            'failed to parse click event: z (1 similar messages suppressed)']
+    # and the pending counts are reported when flushed
+    assert [limit.filter(record(140, i)) for i in range(3)] == [
+            True, True, False]
+    limit.flush()
+    assert reported[-1].getMessage() == (
+            'failed to parse click event: 2 (1 similar messages suppressed)')
+
+
+async def test_rate_limit_filter_threads():
+    # more groups than MAX_GROUPS, logged concurrently: every record is either
+    # let through or counted in a report
+    limit = RateLimitFilter(burst=5, interval=60)
+    passed = []
+    reported = []
+    limit.report = reported.append
+    def log():
+        for i in range(2000):
+            record = logging.LogRecord('i3hub', logging.WARNING, __file__, 1,
+                    'message %s', (i % 1100,), None)
+            record.msg = 'message {}'.format(i % 1100)
+            if limit.filter(record):
+                passed.append(record)
+    threads = [threading.Thread(target=log) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    limit.flush()
+    suppressed = 0
+    for record in passed + reported:
+        match = re.search(r'\((\d+) similar', record.msg)
+        if match:
+            suppressed += int(match.group(1))
+    assert len(passed) + suppressed == 8000
+
+
+async def test_log_manager(tmpdir):
+    log_file = tmpdir.join('i3hub.log')
+    log_file.write('previous run\n')
+    log = LogManager(str(log_file))
+    try:
+        log.configure({'log_level': 'warning',
+            'log_levels': {'i3hub.test': 'debug'}})
+        logging.getLogger('i3hub.test').debug('debug message')
+        logging.getLogger('i3hub.other').info('info message')
+    finally:
+        log.close()
+        # restore the default levels
+        log.configure({'log_level': 'warning'})
+    assert tmpdir.join('i3hub.log.1').read() == 'previous run\n'
+    lines = log_file.read().splitlines()
+    assert len(lines) == 1
+    assert lines[0].endswith('DEBUG i3hub.test: debug message')
+
+
+
+async def test_log_manager_replays_buffered_records(tmpdir):
+    log_file = tmpdir.join('i3hub.log')
+    buffer = buffer_logging()
+    logging.getLogger('i3hub.test').warning('before logging was set up')
+    log = LogManager(str(log_file))
+    try:
+        log.replay(buffer)
+        assert buffer not in logging.getLogger().handlers
+    finally:
+        log.close()
+    lines = log_file.read().splitlines()
+    assert len(lines) == 1
+    assert lines[0].endswith('WARNING i3hub.test: before logging was set up')
+
+RELOADABLE_EXTENSION = """
+from ..i3hub import listen
+
+events = []
+
+@listen('i3hub::init')
+@listen('i3hub::unload')
+@listen('i3::window')
+async def handler(i3, event, arg):
+    events.append(('{}', event))
+"""
+
+
+async def test_reload_extension(i3hub, i3mock, tmpdir):
+    spec_name = '{}.reloadable'.format(extension.__name__.rsplit('.', 1)[0])
+    path = tmpdir.join('reloadable.py')
+    path.write(RELOADABLE_EXTENSION.format('v1'))
+    old = exec_extension_module(spec_name, str(path))
+    await i3hub.load_extension('reloadable', old)
+    await spin()
+    path.write(RELOADABLE_EXTENSION.format('v2'))
+    assert i3hub.extension_paths()[str(path)] == 'reloadable'
+    await i3hub.reload_extension('reloadable')
+    await spin()
+    new = sys.modules[spec_name]
+    i3mock.send_event(i3event(3, '[1]'))
+    await spin()
+    assert old.events == [('v1', 'i3hub::init'), ('v1', 'i3hub::unload')]
+    assert new.events == [('v2', 'i3hub::init'), ('v2', 'i3::window')]
+    await i3hub.unload_extension('reloadable')
+    assert spec_name not in sys.modules
+    assert 'reloadable' not in i3hub.extension_names
+
+
+async def test_inotify(tmpdir):
+    inotify = Inotify()
+    inotify.watch(str(tmpdir))
+    tmpdir.join('a.cfg').write('')
+    tmpdir.join('b.tmp').write('')
+    tmpdir.join('b.tmp').rename(tmpdir.join('b.py'))
+    assert inotify.read() == [str(tmpdir.join('a.cfg')),
+            str(tmpdir.join('b.tmp')), str(tmpdir.join('b.py'))]
+    assert inotify.read() == []
+    inotify.close()
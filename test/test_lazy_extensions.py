@@ -0,0 +1,92 @@
+import asyncio
+import json
+import pytest
+
+from .util import i3event, spin
+
+pytestmark = pytest.mark.asyncio
+run_i3hub = True
+lazy_extensions = {
+    'lazy_extension': ['i3::window', 'nop::lazy-verb'],
+    'slow_extension': ['nop::slow-verb'],
+    'hung_extension': ['nop::hung-verb'],
+}
+
+
+def lazy_module(i3hub):
+    return i3hub._lazy_extensions['lazy_extension'].module
+
+
+def binding(command):
+    return i3event(5, json.dumps({'change': 'run',
+        'binding': {'command': command}}))
+
+
+async def test_lazy_extension_loaded_by_i3_event(i3hub, i3mock):
+    assert lazy_module(i3hub) is None
+    i3mock.send_event(i3event(3, '[1]'))
+    await spin()
+    i3mock.send_event(i3event(3, '[2]'))
+    await spin()
+    assert lazy_module(i3hub).events == [
+        ('i3hub::init', {'running_as_status': True, 'config': {}}),
+        ('i3::window', [1]),
+        ('i3::window', [2]),
+    ]
+
+
+async def test_lazy_extension_loaded_by_nop_binding(i3hub, i3mock):
+    i3mock.send_event(binding('nop lazy-verb x'))
+    # the binding is routed, loads the extension and is dispatched again,
+    # which takes a few more iterations on uvloop
+    await spin(10)
+    assert lazy_module(i3hub).events[1:] == [('nop::lazy-verb', ['x'])]
+
+
+async def test_require_loads_lazy_extension(i3hub, i3api):
+    module = i3api.require('lazy_extension')
+    assert module is lazy_module(i3hub)
+    await spin()
+    assert module.events == [
+        ('i3hub::init', {'running_as_status': True, 'config': {}})
+    ]
+
+
+async def test_lazy_extension_that_fails_to_load(i3hub, i3mock, tmpdir):
+    lazy = i3hub._lazy_extensions['lazy_extension']
+    lazy.module_path = str(tmpdir.join('missing.py'))
+    i3mock.send_event(i3event(3, '[1]'))
+    await spin()
+    # waiting for the extension fails instead of hanging
+    assert lazy.ready.done()
+    assert isinstance(lazy.ready.exception(), OSError)
+    assert lazy_module(i3hub) is None
+
+
+async def test_handlers_wait_for_slow_init(i3hub, i3api, i3barmock):
+    module = i3api.require('slow_extension')
+    await spin()
+    assert not module.initialized
+    # none of these reach the extension before its init handler returns
+    i3api.refresh_i3bar()
+    i3barmock.send_click(b'[\n{"name":"slow"}\n')
+    await i3api.emit_event('slow-event', None)
+    await spin()
+    assert module.events == []
+    await asyncio.sleep(0.1)
+    assert ('i3hub::i3bar_click', True) in module.events
+    assert ('extension::slow-event', True) in module.events
+    assert ('i3hub::i3bar_refresh', True) in module.events
+    assert all(initialized for _, initialized in module.events)
+
+
+async def test_init_timeout_cancels_hung_init(i3hub, i3api):
+    i3hub._config = {'i3hub': {'init_timeout': 0.05}}
+    module = i3api.require('hung_extension')
+    await i3api.emit_event('hung-event', None)
+    await spin()
+    assert module.events == ['i3hub::init']
+    await asyncio.sleep(0.1)
+    # init was given up, queued events are delivered
+    assert i3hub._ready['hung_extension'].done()
+    assert module.events == ['i3hub::init', 'extension::hung-event']
@@ -0,0 +1,52 @@
+import asyncio
+import os
+import signal
+import pytest
+
+from ..i3hub import Spawner, CONT_SIGNAL
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture(params=[True, False], ids=['forkserver', 'asyncio'])
+def spawner(request, event_loop):
+    spawner = Spawner()
+    if request.param:
+        spawner.start_server()
+    spawner.attach(event_loop)
+    yield spawner
+    spawner.close()
+
+
+async def test_spawn_communicate(spawner):
+    proc = await spawner.spawn('cat', stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE)
+    stdout, _ = await proc.communicate(b'hello')
+    assert stdout == b'hello'
+    assert proc.returncode == 0
+    assert spawner.stats['spawned'] == 1
+    assert spawner.stats['last_latency'] is not None
+
+
+async def test_spawn_returncode_cwd_and_env(spawner, tmpdir):
+    proc = await spawner.spawn('sh', '-c', 'echo $FOO; pwd; exit 3',
+            stdout=asyncio.subprocess.PIPE, cwd=str(tmpdir),
+            env={'FOO': 'bar', 'PATH': os.environ['PATH']})
+    stdout = await proc.stdout.read()
+    assert stdout.decode('utf-8').split() == ['bar', str(tmpdir)]
+    assert await proc.wait() == 3
+
+
+async def test_spawn_ignore_signals(spawner):
+    # a realtime signal, uvloop resets the standard ones in the child
+    proc = await spawner.spawn('sleep', '10', ignore_signals=[CONT_SIGNAL])
+    proc.send_signal(CONT_SIGNAL)
+    await asyncio.sleep(0.1)
+    assert proc.returncode is None
+    proc.terminate()
+    assert await proc.wait() == -signal.SIGTERM
+
+
+async def test_spawn_missing_program(spawner):
+    with pytest.raises(OSError):
+        await spawner.spawn('i3hub-missing-program')
@@ -0,0 +1,47 @@
+import pytest
+
+from .util import load_contrib
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture(scope='module')
+def sa():
+    return load_contrib('split_alternator')
+
+
+async def test_changes_tree(sa):
+    assert not sa.changes_tree('focus left')
+    assert not sa.changes_tree('workspace 2; focus parent')
+    assert not sa.changes_tree('[class="a;split"] focus')
+    assert not sa.changes_tree('nop toggle-split-alternator')
+    assert sa.changes_tree('split v')
+    assert sa.changes_tree('layout tabbed')
+    assert sa.changes_tree('focus left; move right')
+    assert sa.changes_tree('[class=x] focus, kill')
+
+
+class I3(object):
+    event_loop = None
+
+    def __init__(self):
+        self.trees = 0
+
+    async def get_tree(self):
+        self.trees += 1
+        return {'layout': 'splith', 'nodes': [{'id': 1, 'nodes': []}]}
+
+
+async def test_focus_bindings_keep_the_tree_cache(sa, event_loop):
+    i3 = I3()
+    alternator = sa.SplitAlternator(i3)
+    def binding(command):
+        return alternator.on_binding('i3::binding', {'change': 'run',
+            'binding': {'command': command}})
+    assert await alternator._get_parent_layout(1) == 'splith'
+    await binding('focus left')
+    assert await alternator._get_parent_layout(1) == 'splith'
+    assert i3.trees == 1
+    await binding('layout tabbed')
+    await alternator._get_parent_layout(1)
+    assert i3.trees == 2
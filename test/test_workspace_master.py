@@ -0,0 +1,62 @@
+import asyncio
+import pytest
+
+from .util import load_contrib
+
+
+@pytest.fixture(scope='module')
+def wm():
+    return load_contrib('workspace_master')
+
+
+def test_parse_wait(wm):
+    assert wm.parse_wait('exec firefox') is None
+    assert wm.parse_wait('[wait-for-window]') == ({}, None)
+    criteria, timeout = wm.parse_wait(
+            '[wait-for-window class="^fire fox$" instance=urxvt timeout=2.5]')
+    assert sorted(criteria) == ['class', 'instance']
+    assert criteria['class'].pattern == '^fire fox$'
+    assert criteria['instance'].pattern == 'urxvt'
+    assert timeout == 2.5
+
+
+def test_plan_commands(wm):
+    wait_any = '[wait-for-window]'
+    wait_a = '[wait-for-window class=a]'
+    wait_b = '[wait-for-window class=b]'
+    steps = wm.plan_commands(['split v', 'layout tabbed', 'exec a', wait_a,
+        'exec b', wait_b, 'exec c', wait_any, 'exec d', wait_any, 'focus'])
+    assert [(kind, [c if isinstance(c, str) else c[0] for c in items])
+            for kind, items in steps] == [
+        ('commands', ['split v', 'layout tabbed']),
+        # launches with criteria run in parallel
+        ('launch', ['exec a', 'exec b']),
+        ('launch', ['exec c']),
+        ('launch', ['exec d']),
+        ('commands', ['focus']),
+    ]
+    assert wm.plan_commands([wait_any]) == [('launch', [(None, ({}, None))])]
+
+
+class I3(object):
+    event_loop = None
+
+    def __init__(self):
+        self.messages = []
+
+    async def command(self, message):
+        self.messages.append(message)
+        return [{'success': True}]
+
+
+def test_send_commands_keeps_order(wm):
+    i3 = I3()
+    master = wm.WorkspaceMaster(i3)
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(master._send_commands(
+            ['A', 'B; C', 'D', 'E', '[class=x] focus, layout tabbed', 'F']))
+    finally:
+        loop.close()
+    assert i3.messages == ['A', 'B; C', 'D; E',
+            '[class=x] focus, layout tabbed', 'F']
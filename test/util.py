@@ -1,6 +1,10 @@
 import asyncio
+import importlib.util
 import os
 import struct
+import sys
+
+from .. import i3hub
 
 
 try:
@@ -27,7 +31,9 @@ async def spin(count=DEFAULT_SPIN_COUNT, time=DEFAULT_SPIN_TIME):
         if remaining == 0:
             f.set_result(None)
         else:
-            loop.call_later(time, spin)
+            # uvloop runs timers that expire while running timers in the same
+            # iteration, so always go through call_soon
+            loop.call_soon(loop.call_later, time, spin)
     loop.call_later(time, spin)
     await f
 
@@ -59,3 +65,24 @@ def i3event(msg_type, msg_payload):
     header = b'i3-ipc' + struct.pack('=II', len(body), msg_type | 0x80000000)
     return header + body
 
+
+
+def load_contrib(name):
+    # load an extension from contrib/. They import the installed "i3hub"
+    # module, which is replaced by the one being tested while the extension
+    # is executed.
+    path = os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), 'contrib', name + '.py')
+    previous = sys.modules.get('i3hub')
+    sys.modules['i3hub'] = i3hub
+    try:
+        spec = importlib.util.spec_from_file_location(
+                'i3hub_contrib.' + name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        if previous is None:
+            del sys.modules['i3hub']
+        else:
+            sys.modules['i3hub'] = previous
+    return module